@@ -1,2 +1,9 @@
-from gui import Window
-gui = Window()
\ No newline at end of file
+import sys
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        from cli import main
+        sys.exit(main(sys.argv[1:]))
+    else:
+        from gui import Window
+        gui = Window()
\ No newline at end of file
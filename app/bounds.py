@@ -0,0 +1,48 @@
+from collections import namedtuple
+from fractals import LFractal
+from geometry import directions, period, walk
+from rewriting import Node, Unbalanced, rewrite_tree
+
+Extent = namedtuple('Extent', ['min_x', 'min_y', 'max_x', 'max_y', 'end_x', 'end_y', 'heading'])
+
+def extent(fractal : LFractal, iterations : int, unit = 1.0, max_sequence = 2000000) -> Extent:
+    """Returns the bounds, final position and final heading of the fractal without expanding it
+
+    The bounds of each node of the rewrite tree are computed once for each heading it is reached from,
+    out of its own strokes and moves and the bounds of its children. Systems whose production rules do
+    not restore their own saved positions are expanded and walked instead.
+    """
+    turns = period(fractal.angle())
+    steps = directions(fractal.angle()).tolist()
+    memo = {}
+
+    def bounds(node : Node, heading : int) -> tuple:
+        """Returns the bounds of the node walked from the origin facing the given heading"""
+        key = (node.key, heading)
+        if key not in memo:
+            cos, sin = steps[heading]
+            ends = [(0.0, 0.0)] + [(x, y) for _, _, x, y in node.strokes + node.moves]
+            xs = [cos * x - sin * y for x, y in ends]
+            ys = [sin * x + cos * y for x, y in ends]
+            min_x, min_y, max_x, max_y = min(xs), min(ys), max(xs), max(ys)
+            for child, x, y, turn in node.instances:
+                child_min_x, child_min_y, child_max_x, child_max_y = bounds(child, (heading + turn) % turns)
+                dx, dy = cos * x - sin * y, sin * x + cos * y
+                min_x = min(min_x, dx + child_min_x)
+                min_y = min(min_y, dy + child_min_y)
+                max_x = max(max_x, dx + child_max_x)
+                max_y = max(max_y, dy + child_max_y)
+            memo[key] = (min_x, min_y, max_x, max_y)
+        return memo[key]
+
+    try:
+        root = rewrite_tree(fractal, iterations)
+        min_x, min_y, max_x, max_y = bounds(root, 0)
+        end_x, end_y, turn = root.end_x, root.end_y, root.turn
+    except Unbalanced:
+        geometry, state = walk(fractal.compile(fractal.expand(iterations, max_sequence)), fractal.angle())
+        min_x, min_y, max_x, max_y = geometry.bounds
+        end_x, end_y, turn = state.x, state.y, state.heading
+
+    heading = (turn % turns) * fractal.angle() % 360
+    return Extent(min_x * unit, min_y * unit, max_x * unit, max_y * unit, end_x * unit, end_y * unit, heading)
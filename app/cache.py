@@ -0,0 +1,68 @@
+import numpy as np
+from collections import OrderedDict
+from hashlib import sha1
+from json import dumps
+from os import makedirs, path, remove
+from threading import RLock
+
+class ExpansionCache():
+    """Caches compiled fractal programs by definition and depth, evicting the least recently used beyond a byte budget
+
+    Evicted programs are written to files in spill_directory if one is given, and memory-mapped when used,
+    so they are walked from the page cache instead of being read back into memory.
+    """
+
+    def __init__(self, max_bytes = 256 * 2**20, spill_directory = None):
+        self.max_bytes = max_bytes
+        self.spill_directory = spill_directory
+        self.entries = OrderedDict()
+        self.spilled = {}
+        self.size = 0
+        self.lock = RLock()
+        if spill_directory is not None:
+            makedirs(spill_directory, exist_ok = True)
+
+    @staticmethod
+    def key(fractal) -> str:
+        """Returns a hash of the fractal definition"""
+        return sha1(dumps(fractal.get_tuple(), sort_keys = True).encode('utf-8')).hexdigest()
+
+    def get(self, key : str, depth : int):
+        """Returns the cached program for the fractal hash and depth as bytes, or as a read-only uint8 memmap if spilled, or None"""
+        with self.lock:
+            if (key, depth) in self.entries:
+                self.entries.move_to_end((key, depth))
+                return self.entries[(key, depth)]
+            if (key, depth) in self.spilled:
+                return np.memmap(self.spilled[(key, depth)], dtype = np.uint8, mode = 'r')
+        return None
+
+    def put(self, key : str, depth : int, program : bytes):
+        """Caches the program for the fractal hash and depth"""
+        with self.lock:
+            if (key, depth) in self.entries:
+                self.size -= len(self.entries.pop((key, depth)))
+            self.entries[(key, depth)] = program
+            self.size += len(program)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                evicted_key, evicted = self.entries.popitem(last = False)
+                self.size -= len(evicted)
+                self._spill(evicted_key, evicted)
+
+    def clear(self):
+        """Removes every cached program, including spilled files"""
+        with self.lock:
+            for filename in self.spilled.values():
+                remove(filename)
+            self.entries.clear()
+            self.spilled.clear()
+            self.size = 0
+
+    def _spill(self, key : tuple, program : bytes):
+        # Empty programs cannot be mapped and are cheap to compile again
+        if self.spill_directory is None or not len(program):
+            return
+        filename = path.join(self.spill_directory, f'{key[0]}_{key[1]}.prg')
+        with open(filename, 'wb') as f:
+            f.write(program)
+        self.spilled[key] = filename
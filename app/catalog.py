@@ -0,0 +1,79 @@
+from json import dumps, loads
+from os import makedirs, path, scandir, stat
+from threading import RLock
+
+class Catalog():
+    """Index of saved fractal names to their JSON files, reading each file when first used and again once it changes
+
+    The JSON text is cached and parsed on every get, so callers never share the lists and dicts of a cached fractal.
+    The index is rebuilt from file names alone when the modification time of the directory changes.
+    """
+
+    extension = '.json'
+
+    def __init__(self, directory : str):
+        self.directory = directory
+        self.paths = {}
+        self.entries = {}
+        self.scanned = None
+        self.lock = RLock()
+
+    def names(self) -> list:
+        """Returns the sorted names of every saved fractal"""
+        with self.lock:
+            self._scan()
+            return sorted(self.paths)
+
+    def path(self, name : str) -> str:
+        """Returns the file that the fractal of the given name is or would be saved in"""
+        return path.join(self.directory, name + Catalog.extension)
+
+    def get(self, name : str) -> tuple:
+        """Returns a new fractal tuple saved under the name, reading its file only if it changed since last read"""
+        filename = self.path(name)
+        modified = stat(filename).st_mtime_ns
+        with self.lock:
+            cached = self.entries.get(name)
+        if cached is None or cached[0] != modified:
+            with open(filename) as f:
+                text = f.read()
+            cached = (modified, text)
+            with self.lock:
+                self.paths[name] = filename
+                self.entries[name] = cached
+        return tuple(loads(cached[1]))
+
+    def save(self, name : str, fractal_tuple : tuple) -> str:
+        """Saves the fractal tuple under the name; returns its file"""
+        makedirs(self.directory, exist_ok = True)
+        filename = self.path(name)
+        text = dumps(fractal_tuple)
+        with open(filename, mode = 'w') as f:
+            f.write(text)
+        with self.lock:
+            self.paths[name] = filename
+            self.entries[name] = (stat(filename).st_mtime_ns, text)
+        return filename
+
+    def __contains__(self, name : str) -> bool:
+        with self.lock:
+            self._scan()
+            return name in self.paths
+
+    def __len__(self) -> int:
+        with self.lock:
+            self._scan()
+            return len(self.paths)
+
+    def _scan(self):
+        modified = stat(self.directory).st_mtime_ns if path.isdir(self.directory) else None
+        if modified == self.scanned:
+            return
+        self.paths = {}
+        if modified is not None:
+            with scandir(self.directory) as files:
+                for file in files:
+                    if file.name.endswith(Catalog.extension) and file.is_file():
+                        self.paths[file.name[:-len(Catalog.extension)]] = file.path
+        self.entries = {name : entry for name, entry in self.entries.items() if name in self.paths}
+        self.scanned = modified
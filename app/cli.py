@@ -0,0 +1,154 @@
+import argparse, sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from json import load
+from os import makedirs, path
+from time import time
+from bounds import Unbalanced, extent
+from catalog import Catalog
+from fractals import LFractal, sequence_lengths
+from instancing import write_instanced_svg
+from planning import plan
+from stats import DrawStats
+from raster import rasterize, rasterize_program
+from vector import program_chunks, write_svg, write_segments
+
+FRACTALS_DIRECTORY = 'saved_fractals'
+FORMATS = ['png', 'svg', 'seg']
+
+def load_fractal(name : str) -> tuple:
+    """Returns the name and fractal tuple of a saved fractal name or a JSON file in the get_tuple format"""
+    if name.endswith('.json') or path.isfile(name):
+        with open(name) as f:
+            return path.splitext(path.basename(name))[0], tuple(load(f))
+    return name, Catalog(FRACTALS_DIRECTORY).get(name)
+
+def render(fractal : LFractal, iterations : int, size : int, format : str, file, max_sequence = 2000000, stats = None, simplify = False, stream = False, instance = False,
+           min_pixels = 1.0) -> DrawStats:
+    """Renders the fractal into a binary file in the given format; returns the DrawStats of every phase
+
+    If simplify is set, raster images are drawn from geometry with duplicate and collinear segments merged and runs shorter than min_pixels culled.
+    Vector formats, and raster images if stream is set, are drawn from the streamed program without the max_sequence limit.
+    If instance is set, SVG files define the shape of each symbol at each depth once and reuse it, where the fractal allows.
+    """
+    stats = DrawStats() if stats is None else stats
+    if format == 'png' and stream:
+        with stats.phase('bounds'):
+            bounds = extent(fractal, iterations, max_sequence = max_sequence)[:4]
+        stats.sequence_lengths = sequence_lengths(fractal, iterations)
+        stats.sequence_length = stats.sequence_lengths[-1]
+        stats.segments = plan(fractal, iterations).segments
+        with stats.phase('render'):
+            rasterize_program(lambda : program_chunks(fractal, iterations), fractal.angle(), bounds, size, size).save(file, 'PNG')
+    elif format == 'png':
+        geometry = fractal.generate(1, iterations, max_sequence, stats = stats)
+        with stats.phase('render'):
+            rasterize(geometry, size, size, simplify = simplify, min_pixels = min_pixels).save(file, 'PNG')
+    elif format == 'svg' and instance and _instanced(fractal, iterations, size, file, stats):
+        pass
+    elif format == 'svg' or format == 'seg':
+        chunks = program_chunks(fractal, iterations)
+        with stats.phase('render'):
+            if format == 'svg':
+                walker = write_svg(chunks, fractal.angle(), file, size = size)
+            else:
+                walker = write_segments(chunks, fractal.angle(), file)
+        stats.segments = walker.segments
+    else:
+        raise ValueError(f'Unknown format {format}')
+
+    if stats.phases['render'] > 0:
+        stats.segments_per_second = stats.segments / stats.phases['render']
+    stats.finish()
+    return stats
+
+def _instanced(fractal : LFractal, iterations : int, size : int, file, stats : DrawStats) -> bool:
+    # Write an instanced SVG file; returns False if the fractal cannot be instanced
+    try:
+        with stats.phase('render'):
+            root = write_instanced_svg(fractal, iterations, file, size = size)
+    except Unbalanced:
+        return False
+    stats.segments = root.segments
+    return True
+
+def render_job(fractal_tuple : tuple, iterations : int, size : int, format : str, filename : str, max_sequence : int, simplify = False, stream = False, instance = False,
+               trace_memory = False, min_pixels = 1.0) -> dict:
+    """Renders a fractal tuple into a file; returns its stats as a dictionary, with peak memory if trace_memory is set"""
+    fractal = LFractal()
+    fractal.load_tuple(fractal_tuple)
+    stats = DrawStats(trace_memory = trace_memory)
+    with open(filename, 'wb') as file:
+        return render(fractal, iterations, size, format, file, max_sequence, stats, simplify = simplify, stream = stream, instance = instance,
+                      min_pixels = min_pixels).as_dict()
+
+def render_command(args) -> int:
+    try:
+        fractals = [load_fractal(name) for name in args.fractals]
+    except (OSError, ValueError) as e:
+        print(f'ERROR: {e}')
+        return 2
+
+    makedirs(args.output, exist_ok = True)
+    start = time()
+    failed = 0
+    with ProcessPoolExecutor(max_workers = args.jobs) as executor:
+        jobs = {}
+        for name, fractal_tuple in fractals:
+            for iterations in args.iterations:
+                filename = path.join(args.output, f'{name}_{iterations}.{args.format}')
+                future = executor.submit(render_job, fractal_tuple, iterations, args.size, args.format, filename, args.max_sequence, args.simplify, args.stream, args.instance, args.trace_memory,
+                                         args.min_pixels)
+                jobs[future] = (name, iterations, filename)
+
+        for future in as_completed(jobs):
+            name, iterations, filename = jobs[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed += 1
+                print(f'FAILED {name} ({iterations} iterations): {e}')
+            else:
+                phases = ', '.join(f'{phase} {round(seconds, 3)}' for phase, seconds in stats['phases'].items())
+                peak = '' if stats['peak_memory'] is None else f', peak {stats["peak_memory"] // 1024} KiB'
+                print(f'{name} ({iterations} iterations) -> {filename} in {round(stats["total"], 3)} sec ({phases}){peak}')
+
+    print(f'Rendered {len(jobs) - failed} of {len(jobs)} images in {round(time() - start, 3)} sec')
+    return 1 if failed else 0
+
+def serve_command(args) -> int:
+    # Import the service only when serving, since it imports this module
+    import service
+    return service.serve_command(args)
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python app', description = 'Lindenmayer turtle fractals')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    render_parser = commands.add_parser('render', help = 'render fractals to files without the GUI')
+    render_parser.add_argument('fractals', nargs = '+', help = f'names of fractals in {FRACTALS_DIRECTORY}/ or paths to JSON files')
+    render_parser.add_argument('-i', '--iterations', type = int, nargs = '+', default = [4], help = 'iteration depths to render')
+    render_parser.add_argument('-s', '--size', type = int, default = 1024, help = 'image width and height in pixels')
+    render_parser.add_argument('-f', '--format', choices = FORMATS, default = 'png', help = 'output format')
+    render_parser.add_argument('-o', '--output', default = 'images', help = 'output directory')
+    render_parser.add_argument('-j', '--jobs', type = int, default = None, help = 'number of worker processes')
+    render_parser.add_argument('--max-sequence', type = int, default = 2000000, help = 'maximum length of an expanded sequence, for png images drawn without --stream')
+    render_parser.add_argument('--simplify', action = 'store_true', help = 'merge duplicate, collinear and sub-pixel segments before rasterizing')
+    render_parser.add_argument('--min-pixels', type = float, default = 1.0, help = 'with --simplify, cull runs of segments shorter than this many pixels')
+    render_parser.add_argument('--stream', action = 'store_true', help = 'draw png images from the streamed program without expanding the sequence')
+    render_parser.add_argument('--instance', action = 'store_true', help = 'write svg files that define each repeated shape once and reuse it')
+    render_parser.add_argument('--trace-memory', action = 'store_true', help = 'report peak memory traced while rendering, which slows rendering down')
+    render_parser.set_defaults(run = render_command)
+
+    serve_parser = commands.add_parser('serve', help = 'serve renders of fractal definitions over HTTP')
+    serve_parser.add_argument('--host', default = '127.0.0.1', help = 'address to listen on')
+    serve_parser.add_argument('-p', '--port', type = int, default = 8000, help = 'port to listen on')
+    serve_parser.add_argument('-j', '--jobs', type = int, default = None, help = 'number of worker processes')
+    serve_parser.add_argument('--cache-size', type = int, default = 256, help = 'megabytes of rendered files to cache')
+    serve_parser.add_argument('--max-sequence', type = int, default = 2000000, help = 'maximum length of an expanded sequence')
+    serve_parser.set_defaults(run = serve_command)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
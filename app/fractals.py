@@ -1,10 +1,24 @@
 import turtle
-from math import sin, cos, radians
-from time import time
+from collections import Counter
+from geometry import Geometry, State, join, walk, OP_DRAW, OP_MOVE, OP_RIGHT, OP_LEFT, OP_SAVE, OP_LOAD
+from parallel import parallel_walk
+from stats import DrawStats
+
+class Cancelled(Exception):
+    """Raised by the check method of a cancellation token, such as that of an engine job, once generation is cancelled"""
+
+class SequenceTooLong(Exception):
+    """Raised when a fractal sequence or its geometry would exceed the allowed size"""
 
 class LFractal():
     """Generates fractals using the Lindenmayer system"""
 
+    # Define number of characters or opcodes processed between cancellation checks and progress reports
+    CHUNK_SIZE = 2**20
+
+    # Define longest expansion compiled as one reusable block while streaming
+    BLOCK_SIZE = 2**12
+
     # Define symbol functions
     DRAW    = 'DRAW'
     MOVE    = 'MOVE'
@@ -13,6 +27,8 @@ class LFractal():
     SAVE    = 'SAVE'
     LOAD    = 'LOAD'
 
+    OPCODES = {DRAW : OP_DRAW, MOVE : OP_MOVE, RIGHT : OP_RIGHT, LEFT : OP_LEFT, SAVE : OP_SAVE, LOAD : OP_LOAD}
+
     def __init__(self):
         self.alphabet = []
         self.functions = {}
@@ -53,89 +69,203 @@ class LFractal():
             self._angle = degrees
         return self._angle
 
-    def draw(self, turtle, size : int, iterations : int, max_sequence = 2000000):
-        """Draws the fractal for the given number of iterations"""
+    def expand(self, iterations : int, max_sequence = 2000000, sequence = None, token = None, progress = None) -> str:
+        """Returns the sequence generated by applying the production rules to the axiom, or to the given sequence, for the given number of iterations
+
+        The token is checked and progress(phase, iteration, characters, segments) is called between chunks of each iteration.
+        """
+        sequence = self._axiom if sequence is None else sequence
+        # Predict the length of every generation before building any of them
+        if max(sequence_lengths(self, iterations, sequence)[1:], default = 0) > max_sequence:
+            raise SequenceTooLong(f'Fractal sequence exceeded maximum of {max_sequence} characters')
+
+        chunk_size = LFractal.CHUNK_SIZE
+        for iteration in range(iterations):
+            chunks = []
+            characters = 0
+            for start in range(0, len(sequence), chunk_size):
+                if token is not None:
+                    token.check()
+                chunks.append(''.join(map(self.rules.__getitem__, sequence[start:start + chunk_size])))
+                characters += len(chunks[-1])
+                if progress is not None:
+                    progress('expand', iteration + 1, characters, 0)
+            sequence = ''.join(chunks)
+        return sequence
+
+    def program_stream(self, iterations : int, token = None):
+        """Yields the compiled program after the given number of iterations in chunks of about CHUNK_SIZE opcodes, without expanding the sequence
+
+        The rewrite tree is walked depth first with a stack of iterators over the production rules, and subtrees of at most
+        BLOCK_SIZE symbols are compiled once and reused, so memory is bounded by the iterations, alphabet and block size.
+        """
+        # Count the symbols each symbol expands to at every depth
+        lengths = {symbol : sequence_lengths(self, iterations, symbol) for symbol in self.rules}
+        blocks = {}
+        pieces = []
+        size = 0
+        stack = [(iter(self._axiom), iterations)]
+        while stack:
+            symbols, depth = stack[-1]
+            for symbol in symbols:
+                if lengths[symbol][depth] > LFractal.BLOCK_SIZE:
+                    stack.append((iter(self.rules[symbol]), depth - 1))
+                    break
+                block = blocks.get((symbol, depth))
+                if block is None:
+                    block = blocks[(symbol, depth)] = self.compile(self.expand(depth, sequence = symbol))
+                pieces.append(block)
+                size += len(block)
+                if size >= LFractal.CHUNK_SIZE:
+                    if token is not None:
+                        token.check()
+                    yield b''.join(pieces)
+                    pieces = []
+                    size = 0
+            else:
+                stack.pop()
+        if pieces:
+            yield b''.join(pieces)
+
+    def compile(self, sequence : str) -> bytes:
+        """Compiles a sequence into a program of opcodes; symbols without a function are dropped"""
+        table = {ord(character) : None for character in self.alphabet}
+        for character, function in self.functions.items():
+            opcode = LFractal.OPCODES.get(function)
+            table[ord(character)] = chr(opcode) if opcode else None
+        return sequence.translate(table).encode('latin-1')
+
+    def generate(self, size : float, iterations : int, max_sequence = 2000000, cache = None, token = None, progress = None, stats = None, stream = False, workers = None, out = None) -> Geometry:
+        """Returns the geometry of the fractal for the given unit length and number of iterations; reuses compiled programs from cache if provided
+
+        The token is checked and progress(phase, iteration, characters, segments) is called between chunks of every phase.
+        Phase durations and sizes are recorded in stats, or in new DrawStats kept as self.stats.
+        If stream is set, the program is walked from program_stream as it is compiled, without the max_sequence limit.
+        If workers is set, chunks of the program are walked in that many processes with parallel_walk.
+        If out is given, segments are written into it as they are walked; it must be an (n, 4) array of exactly the segments drawn.
+        """
+        owned = stats is None
+        self.stats = stats = DrawStats() if owned else stats
+        stats.sequence_lengths = sequence_lengths(self, iterations)
+        if stream:
+            self.program = None
+            self.sequence_length = stats.sequence_length = stats.sequence_lengths[-1]
+            chunks = self.program_stream(iterations, token)
+        else:
+            # Check the limit before looking in the cache, so cached programs are refused like expansions
+            if max(stats.sequence_lengths[1:], default = 0) > max_sequence:
+                raise SequenceTooLong(f'Fractal sequence exceeded maximum of {max_sequence} characters')
+            self.sequence_length = stats.sequence_length = stats.sequence_lengths[-1]
+            key = None if cache is None else cache.key(self)
+            self.program = None if cache is None else cache.get(key, iterations)
+            if self.program is None:
+                with stats.phase('expand'):
+                    sequence = self.expand(iterations, max_sequence, token = token, progress = progress)
+                if token is not None:
+                    token.check()
+                with stats.phase('compile'):
+                    self.program = self.compile(sequence)
+                    del sequence
+                if cache is not None:
+                    cache.put(key, iterations, self.program)
+            chunks = (self.program[start:start + LFractal.CHUNK_SIZE] for start in range(0, len(self.program), LFractal.CHUNK_SIZE))
+
+        with stats.phase('walk'):
+            if workers is not None:
+                report = None if progress is None else lambda segments : progress('walk', iterations, self.sequence_length, segments)
+                geometry, _ = parallel_walk(chunks, self._angle, size, workers = workers, token = token, progress = report, out = out)
+            else:
+                # Walk program in chunks, carrying the turtle state across them
+                parts = []
+                state = State()
+                segments = 0
+                for chunk in chunks:
+                    if token is not None:
+                        token.check()
+                    part, state = walk(chunk, self._angle, size, state)
+                    if out is not None:
+                        # Copy into the preallocated segments and keep a view of them instead
+                        out[segments:segments + len(part)] = part.segments
+                        part = Geometry(out[segments:segments + len(part)], part.bounds, part.max_depth)
+                    parts.append(part)
+                    segments += len(part)
+                    if progress is not None:
+                        progress('walk', iterations, self.sequence_length, segments)
+                if out is not None and segments != len(out):
+                    raise ValueError(f'Expected {len(out)} segments but walked {segments}')
+                geometry = join(parts, out)
+        stats.segments = len(geometry)
+        stats.max_stack_depth = geometry.max_depth
+        if owned:
+            stats.finish()
+        return geometry
+
+    def draw(self, turtle, size : int, iterations : int, max_sequence = 2000000, fit = None, cache = None, stats = None) -> DrawStats:
+        """Draws the fractal for the given number of iterations; scales it to fit within fit pixels if specified
+
+        Returns the DrawStats of every phase, recorded into stats if provided.
+        """
+        stats = DrawStats() if stats is None else stats
+        geometry = self.generate(size, iterations, max_sequence, cache, stats = stats)
+        scale = geometry.fit(fit, fit) if fit else 1.0
+        with stats.phase('draw'):
+            self.trace(turtle, geometry.transformed(scale))
+        stats.segments_per_second = len(geometry) / stats.phases['draw'] if stats.phases['draw'] > 0 else None
+        stats.finish()
+        self.time_elapsed = stats.total()
+        return stats
+
+    def trace(self, turtle, geometry : Geometry):
+        """Draws the geometry with the turtle, centered on the turtle's starting position"""
         self.turtle = turtle
         self.turtle.reset()
         self.turtle.active = True
-        start = time()
-        
-        # Generate fractal sequence
-        self.sequence = self._axiom
-        for _ in range(iterations):
-            next_sequence = ''
-            for character in self.sequence:
-                next_sequence += self.rules[character]
-                if len(next_sequence) > max_sequence:
-                    raise Exception(f'Fractal sequence exceeded maximum of {max_sequence} characters')
-            self.sequence = next_sequence
-
-        # Center turtle using generated sequence; relatively fast algorithm
-        sim_x, sim_y = self.turtle.xcor(), self.turtle.ycor()
-        sim_heading = self.turtle.heading()
-        sim_stack = []
-        min_x = max_x = sim_x
-        min_y = max_y = sim_y
-        for character in self.sequence:
-            function = self.functions[character]
-            if function == LFractal.DRAW or function == LFractal.MOVE:
-                sim_x = sim_x + round(size * cos(radians(sim_heading)), 10)
-                sim_y = sim_y + round(size * sin(radians(sim_heading)), 10)
-            elif function == LFractal.RIGHT:
-                sim_heading = (sim_heading - self.angle()) % 360
-            elif function == LFractal.LEFT:
-                sim_heading = (sim_heading + self.angle()) % 360
-            elif function == LFractal.SAVE:
-                sim_stack.append(((sim_x, sim_y), sim_heading))
-            elif function == LFractal.LOAD:
-                position, heading = sim_stack.pop()
-                sim_x, sim_y = position
-                sim_heading = heading
-            min_x = min(min_x, sim_x)
-            max_x = max(max_x, sim_x)
-            min_y = min(min_y, sim_y)
-            max_y = max(max_y, sim_y)
-
-        self.turtle.penup()
-        self.turtle.setx(self.turtle.xcor() - (max_x + min_x) / 2)
-        self.turtle.sety(self.turtle.ycor() - (max_y + min_y) / 2)
-        self.turtle.pendown()
-
-        # TODO:
-        # Scale unit length to fit fractal within specified size
-        length_x = max_x - min_x
-        length_y = max_y - min_y
-        length = max(length_x, length_y)
-        unit = size
-
-        # Draw fractal using generated sequence
-        stack = []
-        for character in self.sequence:
+
+        # Center geometry on the turtle
+        self.geometry = geometry.centered()
+        x, y = self.turtle.pos()
+        segments = self.geometry.segments + (x, y, x, y)
+
+        # Draw fractal segments, lifting the pen wherever a segment does not continue the last one
+        position = (x, y)
+        for x0, y0, x1, y1 in segments.tolist():
             if not self.turtle.active:
                 self.turtle.reset()
                 raise Exception('Fractal generation forcibly stopped')
-            
-            function = self.functions[character]
-            if   function == LFractal.DRAW:
-                self.turtle.forward(unit)
-            elif function == LFractal.MOVE:
-                self.turtle.penup()
-                self.turtle.forward(unit)
-                self.turtle.pendown()
-            elif function == LFractal.RIGHT:
-                self.turtle.right(self._angle)
-            elif function == LFractal.LEFT:
-                self.turtle.left(self._angle)
-            elif function == LFractal.SAVE:
-                stack.append((self.turtle.pos(), self.turtle.heading()))
-            elif function == LFractal.LOAD:
+
+            if (x0, y0) != position:
                 self.turtle.penup()
-                position, heading = stack.pop()
-                self.turtle.setposition(position)
-                self.turtle.setheading(heading)
+                self.turtle.setposition(x0, y0)
                 self.turtle.pendown()
+            self.turtle.setposition(x1, y1)
+            position = (x1, y1)
+
+def generation_counts(fractal : LFractal, iterations : int, sequence = None) -> list:
+    """Returns the number of each symbol in the sequence after each iteration, starting with the axiom or the given sequence, without expanding it
+
+    Each generation's counts are the previous counts spread over the symbols of each production rule.
+    """
+    rule_counts = {symbol : Counter(rule) for symbol, rule in fractal.rules.items()}
+    current = dict.fromkeys(fractal.rules, 0)
+    for symbol, count in Counter(fractal.axiom() if sequence is None else sequence).items():
+        current[symbol] += count
+    generations = [current]
+    for _ in range(iterations):
+        current = dict.fromkeys(fractal.rules, 0)
+        for symbol, count in generations[-1].items():
+            if count:
+                for child, child_count in rule_counts[symbol].items():
+                    current[child] += count * child_count
+        generations.append(current)
+    return generations
+
+def counts(fractal : LFractal, iterations : int, sequence = None) -> dict:
+    """Returns the number of each symbol in the sequence after the given number of iterations of the axiom, or of the given sequence, without expanding it"""
+    return generation_counts(fractal, iterations, sequence)[-1]
 
-        self.time_elapsed = time() - start
+def sequence_lengths(fractal : LFractal, iterations : int, sequence = None) -> list:
+    """Returns the length of the sequence after each iteration, starting with the axiom or the given sequence, without expanding it"""
+    return [sum(generation.values()) for generation in generation_counts(fractal, iterations, sequence)]
 
 def symbol_functions() -> list:
     """Returns a list of symbol function names implemented by the LFractal class"""
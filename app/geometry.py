@@ -0,0 +1,207 @@
+import numpy as np
+from fractions import Fraction
+from math import gcd
+
+# Define opcodes of compiled symbol functions
+OP_DRAW = 1
+OP_MOVE = 2
+OP_RIGHT = 3
+OP_LEFT = 4
+OP_SAVE = 5
+OP_LOAD = 6
+
+class State():
+    """Position, heading in whole turns of the angle, and stack of saved (x, y, heading) tuples of a walking turtle"""
+
+    def __init__(self, x = 0.0, y = 0.0, heading = 0, stack = None):
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.stack = stack if stack is not None else []
+
+class Geometry():
+    """Segments drawn by a fractal as (x0, y0, x1, y1) rows, (min_x, min_y, max_x, max_y) bounds of every visited position, and deepest stack of saved positions
+
+    The indices returned by breaks may be given if they are already known.
+    """
+
+    def __init__(self, segments : np.ndarray, bounds : tuple, max_depth = 0, breaks = None):
+        self.segments = segments
+        self.bounds = bounds
+        self.max_depth = max_depth
+        self._breaks = breaks
+
+    def __len__(self):
+        return len(self.segments)
+
+    def size(self) -> tuple:
+        """Returns the width and height of the bounds"""
+        min_x, min_y, max_x, max_y = self.bounds
+        return max_x - min_x, max_y - min_y
+
+    def center(self) -> tuple:
+        """Returns the center of the bounds"""
+        min_x, min_y, max_x, max_y = self.bounds
+        return (max_x + min_x) / 2, (max_y + min_y) / 2
+
+    def fit(self, width : float, height : float) -> float:
+        """Returns the scale factor that fits the bounds within the given width and height"""
+        length_x, length_y = self.size()
+        scales = [limit / length for limit, length in ((width, length_x), (height, length_y)) if length > 0]
+        return min(scales) if scales else 1.0
+
+    def transformed(self, scale = 1.0, dx = 0.0, dy = 0.0):
+        """Returns a copy of the geometry scaled about the origin and then translated"""
+        offset = np.array([dx, dy, dx, dy])
+        min_x, min_y, max_x, max_y = self.bounds
+        bounds = (min_x * scale + dx, min_y * scale + dy, max_x * scale + dx, max_y * scale + dy)
+        return Geometry(self.segments * scale + offset, bounds, self.max_depth, self._breaks if scale else None)
+
+    def centered(self, scale = 1.0):
+        """Returns a copy of the geometry scaled and translated so its bounds are centered on the origin"""
+        center_x, center_y = self.center()
+        return self.transformed(scale, -center_x * scale, -center_y * scale)
+
+    def breaks(self) -> np.ndarray:
+        """Returns the indices of segments that do not continue from the end of the previous segment"""
+        if self._breaks is not None:
+            return self._breaks
+        if not len(self.segments):
+            return np.zeros(0, dtype = np.int64)
+        jumps = np.any(self.segments[1:, :2] != self.segments[:-1, 2:], axis = 1)
+        return np.concatenate([[0], np.flatnonzero(jumps) + 1])
+
+    def polylines(self, max_points = None):
+        """Yields each run of connected segments as a flat x0, y0, x1, y1, ... array of at most max_points points"""
+        breaks = self.breaks()
+        ends = np.append(breaks[1:], len(self.segments))
+        step = max_points - 1 if max_points else len(self.segments)
+        for start, end in zip(breaks.tolist(), ends.tolist()):
+            for first in range(start, end, step):
+                run = self.segments[first:min(first + step, end)]
+                yield np.concatenate([run[0, :2], run[:, 2:].ravel()])
+
+def join(geometries : list, segments = None) -> Geometry:
+    """Returns the geometry of consecutive walks as one, using segments if they already hold the segments of every walk in order"""
+    if not geometries:
+        return Geometry(np.zeros((0, 4)) if segments is None else segments, (0.0, 0.0, 0.0, 0.0))
+    if segments is None:
+        segments = np.concatenate([geometry.segments for geometry in geometries])
+    bounds = np.array([geometry.bounds for geometry in geometries])
+    bounds = (float(bounds[:, 0].min()), float(bounds[:, 1].min()), float(bounds[:, 2].max()), float(bounds[:, 3].max()))
+    return Geometry(segments, bounds, max(geometry.max_depth for geometry in geometries))
+
+def period(angle) -> int:
+    """Returns the number of turns of the angle after which the heading repeats"""
+    angle = Fraction(angle).limit_denominator(1000000)
+    full_turn = 360 * angle.denominator
+    return full_turn // gcd(angle.numerator, full_turn) if angle.numerator else 1
+
+def directions(angle, unit = 1.0) -> np.ndarray:
+    """Returns a (period, 2) array of the displacement of one unit for each heading, in turns of the angle"""
+    turns = np.arange(period(angle))
+    radians = np.radians(turns * float(angle))
+    return np.round(np.stack([np.cos(radians), np.sin(radians)], axis = 1), 12) * unit
+
+def walk(program : bytes, angle, unit = 1.0, state = None) -> tuple:
+    """Walks a compiled program from the given state; returns its Geometry and the final State
+
+    Headings and positions are cumulative sums, offset after each LOAD from the state at its matching
+    SAVE. Chains of these offsets are resolved by pointer jumping over the SAVEs that LOADs return to.
+    """
+    state = state if state is not None else State()
+    ops = np.frombuffer(program, dtype = np.uint8)
+    count = len(ops)
+    carried = len(state.stack)
+    index = np.arange(count)
+
+    # Match each LOAD with the latest SAVE that opened the same bracket depth
+    is_save = ops == OP_SAVE
+    is_load = ops == OP_LOAD
+    depth_change = is_save.astype(np.int64) - is_load
+    depth_after = np.cumsum(depth_change)
+    depth_before = depth_after - depth_change
+    saves = index[is_save]
+    loads = index[is_load]
+    lowest = min(int(depth_after.min()), 0) if count else 0
+    stride = count + 1
+    save_keys = (depth_after[saves] - lowest) * stride + saves
+    order = np.argsort(save_keys, kind = 'stable')
+    save_keys = save_keys[order]
+    load_keys = (depth_before[loads] - lowest) * stride + loads
+    found = np.searchsorted(save_keys, load_keys) - 1
+    candidate = saves[order][np.maximum(found, 0)] if len(saves) else np.zeros(len(loads), dtype = np.int64)
+    matched = (found >= 0) & (depth_after[candidate] == depth_before[loads]) if len(saves) else np.zeros(len(loads), dtype = bool)
+    stack_index = carried + depth_before[loads] - 1
+    if np.any(~matched & (stack_index < 0)):
+        raise IndexError('pop from empty list')
+
+    # Nodes 0 to carried - 1 are the carried stack, node carried is the start state and node carried + 1 + i follows op i
+    root_count = carried + 1
+    targets = np.where(matched, candidate + root_count, stack_index)
+    anchors = np.unique(targets[matched])
+    compact = np.concatenate([np.arange(root_count), anchors])
+    last_load = np.maximum.accumulate(np.where(is_load, index, -1)) if len(loads) else None
+    if last_load is not None:
+        load_parents = np.full(count, root_count - 1, dtype = np.int64)
+        load_parents[loads] = np.searchsorted(compact, targets)
+        op_parents = load_parents[np.maximum(last_load, 0)]
+        op_parents[last_load < 0] = root_count - 1
+        anchor_parents = op_parents[anchors - root_count]
+
+    def resolve(values : np.ndarray, roots : np.ndarray) -> np.ndarray:
+        """Returns the values after every op given their cumulative sums since the start"""
+        if last_load is None:
+            return values + roots[-1]
+
+        # Pointer jump over the saves that LOADs return to, so every op is an offset from a resolved node
+        offsets = values - np.where(last_load >= 0, values[np.maximum(last_load, 0)], 0)
+        jump_parent = np.concatenate([np.arange(root_count), anchor_parents])
+        jump_value = np.concatenate([np.zeros_like(roots), offsets[anchors - root_count]])
+        while True:
+            pending = jump_parent >= root_count
+            if not pending.any():
+                break
+            jump_value = jump_value + np.where(pending, jump_value[jump_parent], 0)
+            jump_parent = np.where(pending, jump_parent[jump_parent], jump_parent)
+        jump_value = jump_value + roots[jump_parent]
+        return jump_value[op_parents] + offsets
+
+    saved = state.stack + [(state.x, state.y, state.heading)]
+    saved_x = np.array([entry[0] for entry in saved], dtype = np.float64)
+    saved_y = np.array([entry[1] for entry in saved], dtype = np.float64)
+    saved_heading = np.array([entry[2] for entry in saved], dtype = np.int64)
+
+    # Resolve headings in whole turns, then positions from the displacement of each heading
+    turns = (ops == OP_LEFT).astype(np.int64) - (ops == OP_RIGHT)
+    headings = resolve(np.cumsum(turns), saved_heading) % period(angle)
+    moves = (ops == OP_DRAW) | (ops == OP_MOVE)
+    steps = directions(angle, unit)
+    xs = resolve(np.cumsum(np.where(moves, steps[:, 0][headings], 0.0)), saved_x)
+    ys = resolve(np.cumsum(np.where(moves, steps[:, 1][headings], 0.0)), saved_y)
+
+    # Collect segments drawn and bounds of every visited position
+    drawn = np.flatnonzero(ops == OP_DRAW)
+    segments = np.empty((len(drawn), 4))
+    segments[:, 2] = xs[drawn]
+    segments[:, 3] = ys[drawn]
+    previous = drawn - 1
+    segments[:, 0] = np.where(previous >= 0, xs[previous], state.x)
+    segments[:, 1] = np.where(previous >= 0, ys[previous], state.y)
+    bounds = (state.x, state.y, state.x, state.y)
+    if count:
+        bounds = (min(float(xs.min()), state.x), min(float(ys.min()), state.y), max(float(xs.max()), state.x), max(float(ys.max()), state.y))
+
+    # Build final state from the last position and every SAVE left open
+    kept = state.stack[:carried + lowest]
+    closed = np.zeros(count, dtype = bool)
+    closed[candidate[matched]] = True
+    open_saves = saves[~closed[saves]]
+    stack = kept + [(float(xs[i]), float(ys[i]), int(headings[i])) for i in open_saves]
+    if count:
+        final = State(float(xs[-1]), float(ys[-1]), int(headings[-1]), stack)
+    else:
+        final = State(state.x, state.y, state.heading, stack)
+
+    max_depth = carried + max(int(depth_after.max()), 0) if count else carried
+    return Geometry(segments, bounds, max_depth), final
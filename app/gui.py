@@ -1,10 +1,14 @@
 import tkinter as tk
 
-from os import listdir, path, remove
-from json import dump, load
 from turtle import RawTurtle, TurtleScreen
 from fractals import LFractal, symbol_functions
-from PIL import Image
+from catalog import Catalog
+from renderer import CanvasRenderer
+from shared import GeometryEngine
+from planning import Plan, plan
+from stats import DrawStats
+from spatial import DetailLevels
+from raster import rasterize
 import random, datetime
 
 """
@@ -15,6 +19,12 @@ by Tushar Khan
 class Window():
 
     fractals_directory = 'saved_fractals'
+    image_size = 4096
+    min_segment_length = 0.5
+    redraw_delay = 100
+    max_geometry_bytes = 2**30
+    warn_geometry_bytes = 2**28
+    max_turtle_segments = 100000
 
     def __init__(self):
         # Set window and window elements constants
@@ -31,6 +41,7 @@ class Window():
         # Create top-level window and add canvas and control panel
         root = tk.Tk()
         root.title('Lindenmayer Turtle Fractals')
+        self.catalog = Catalog(Window.fractals_directory)
         self.canvas = tk.Canvas(root, width = canvas_width, height = window_height, cursor = 'crosshair')
         panel = tk.Frame(root, width = panel_width, height = window_height)
         self.canvas.pack(side = 'left', fill = 'both', expand = True)
@@ -69,8 +80,7 @@ class Window():
         # Add load fractal option menu widget
         self.fractal_var = tk.StringVar()
         self.fractal_var.set('Custom')
-        fractal_dict = self._generate_fractals_dictionary()
-        self.fractal_menu = tk.OptionMenu(self.editor_frame, self.fractal_var, *list(fractal_dict.keys()))
+        self.fractal_menu = tk.OptionMenu(self.editor_frame, self.fractal_var, *self.catalog.names())
         self.fractal_var.trace_add('write', callback = self._load_fractal)
         self.fractal_menu.grid(row = 0, column = 1, columnspan = 2, sticky = 'ew')
 
@@ -121,9 +131,24 @@ class Window():
         speed_scale = tk.Scale(panel, orient = 'horizontal', from_ = 1, to = 100, label = 'Speed:', variable = self.speed_var)
         self.size_scale = tk.Scale(panel, orient = 'horizontal', from_ = 1, to = 50, label = 'Unit Length:', resolution = 1)
         self.size_scale.set(25)
+        self.fast_var = tk.BooleanVar()
+        self.fast_var.set(True)
+        self.geometry = None
+        fast_button = tk.Checkbutton(panel, text = 'Fast Render', variable = self.fast_var, anchor = 'w')
+        self.memory_var = tk.BooleanVar()
+        memory_button = tk.Checkbutton(panel, text = 'Trace Memory', variable = self.memory_var, anchor = 'w')
         self.iterations_scale.pack(fill = 'x')
         speed_scale.pack(fill = 'x')
         self.size_scale.pack(fill = 'x')
+        fast_button.pack(fill = 'x')
+        memory_button.pack(fill = 'x')
+        self.renderer = None
+        self.job = None
+        self.shared = None
+        self.engine = GeometryEngine()
+        self.detail = None
+        self.redraw_job = None
+        self._reset_view()
             
         # Add and configure fractal buttons
         button_frame = tk.Frame(panel, width = panel_width)
@@ -152,23 +177,20 @@ class Window():
 
         # Run tkinter loop
         root.mainloop()
+        self._release_geometry()
+        self.engine.close()
 
-    def _generate_fractals_dictionary(self) -> dict:
-        """Loads fractals from save files into a dictionary"""
-        fractal_dict = {}
-        directory = Window.fractals_directory
-        for file in listdir(directory):
-            if file.endswith('.json'):
-                with open(directory + '/' + file) as f:
-                    fractal_tuple = tuple(load(f))
-                    fractal_dict[file[:-len('.json')]] = fractal_tuple
-        return fractal_dict
+    def _update_fractals_menu(self):
+        """Replaces the entries of the load fractal menu with the names in the catalog"""
+        menu = self.fractal_menu['menu']
+        menu.delete(0, 'end')
+        for name in self.catalog.names():
+            menu.add_command(label = name, command = tk._setit(self.fractal_var, name))
 
     def _load_fractal(self, *_):
-        # Load fractal from fractal dictionary
+        # Load fractal from catalog
         fractal = LFractal()
-        fractal_dict = self._generate_fractals_dictionary()
-        fractal.load_tuple(fractal_dict[self.fractal_var.get()])
+        fractal.load_tuple(self.catalog.get(self.fractal_var.get()))
 
         # Update window elements
         self.alphabet_var.set(fractal.alphabet)
@@ -203,29 +225,172 @@ class Window():
         elif self.axiom_var.get() == '':
             self.textbox_label.configure(fg = 'orange')
             self.textbox_var.set(f'INVALID: Axiom not defined')
+        elif set(fractal.axiom()).union(*fractal.rules.values()) - set(fractal.rules):
+            self.textbox_label.configure(fg = 'orange')
+            self.textbox_var.set(f'INVALID: Production rules not defined for {" ".join(sorted(set(fractal.axiom()).union(*fractal.rules.values()) - set(fractal.rules)))}')
         else:
-            self.canvas.unbind('<ButtonPress-1>')
-            self.canvas.unbind('<B1-Motion>')
-            self.canvas.unbind('<MouseWheel>')
+            # Plan the exact size of the fractal before generating it
+            fractal_plan = plan(fractal, self.iterations_scale.get(), max_bytes = Window.max_geometry_bytes)
+            megabytes = fractal_plan.geometry_bytes // 2**20
+            if fractal_plan.strategy == Plan.REFUSE:
+                self.textbox_label.configure(fg = 'orange')
+                self.textbox_var.set(f'INVALID: {fractal_plan.segments} segments need {megabytes} MB, over the limit of {Window.max_geometry_bytes // 2**20} MB')
+            elif not self.fast_var.get() and fractal_plan.segments > Window.max_turtle_segments:
+                self.textbox_label.configure(fg = 'orange')
+                self.textbox_var.set(f'INVALID: {fractal_plan.segments} segments are too many to draw with the turtle, use Fast Render')
+            else:
+                self.canvas.unbind('<ButtonPress-1>')
+                self.canvas.unbind('<B1-Motion>')
+                self.canvas.unbind('<MouseWheel>')
+                self._reset_fractal()
+                if fractal_plan.geometry_bytes > Window.warn_geometry_bytes:
+                    self.textbox_label.configure(fg = 'orange')
+                    self.textbox_var.set(f'WARNING: {fractal_plan.segments} segments need {megabytes} MB\nDrawing fractal...')
+                self._generate_in_background(fractal, fractal_plan)
+                return
+
+        self.screen.update()
+        self.draw_button.configure(state = 'normal')
+
+    def _generate_in_background(self, fractal : LFractal, fractal_plan : Plan):
+        """Generates the fractal geometry into shared memory in a worker process with the planned strategy, reporting its progress, then draws it"""
+        iterations = fractal_plan.iterations
+        job, future = self.engine.submit(fractal.get_tuple(), self.size_scale.get(), iterations, stream = fractal_plan.stream,
+                                         workers = fractal_plan.workers, segments = fractal_plan.segments, index = True,
+                                         trace_memory = self.memory_var.get())
+        self.job = job
+
+        def poll():
+            progress = [message for message in self.engine.progress() if message[0] == job]
+            if future.done():
+                cancelled = self.job != job
+                if not cancelled:
+                    self.job = None
+                try:
+                    shared, stats = GeometryEngine.result(future)
+                except Exception as e:
+                    if not cancelled:
+                        self._finish_drawing(f'ERROR: {e}', 'red')
+                    return
+                if cancelled:
+                    shared.release()
+                else:
+                    self.shared = shared
+                    self._draw_geometry(fractal, shared.geometry, stats)
+                return
+
+            if progress:
+                _, phase, iteration, characters, segments = progress[-1]
+                if phase == 'expand':
+                    self.textbox_var.set(f'Expanding iteration {iteration} of {iterations}...\n{characters} characters')
+                elif phase == 'index':
+                    self.textbox_var.set(f'Indexing geometry...\n{segments} segments')
+                else:
+                    self.textbox_var.set(f'Computing geometry...\n{segments} segments')
+            self.canvas.after(50, poll)
+
+        self.canvas.after(50, poll)
+
+    def _draw_geometry(self, fractal : LFractal, geometry, stats : DrawStats):
+        """Draws generated geometry with the turtle, or directly onto the canvas in chunks if fast rendering is enabled"""
+        if not self.fast_var.get():
+            self.textbox_var.set('Drawing fractal...')
             try:
-                fractal.draw(self.turtle, self.size_scale.get(), self.iterations_scale.get())
+                with stats.phase('draw'):
+                    fractal.trace(self.turtle, geometry)
             except Exception as e:
-                self.textbox_label.configure(fg = 'red')
-                self.textbox_var.set(f'ERROR: {e}')
+                self._finish_drawing(f'ERROR: {e}', 'red')
             else:
-                self.textbox_label.configure(fg = 'green')
-                self.textbox_var.set(f'Done in {round(fractal.time_elapsed, 8)} sec\n{len(fractal.sequence)} character sequence')
-            self.canvas.bind('<ButtonPress-1>', self._scroll_start)
-            self.canvas.bind('<B1-Motion>', self._scroll_move)
-            self.canvas.bind('<MouseWheel>', self._mouse_scroll)
-
+                self.geometry = fractal.geometry
+                self._index_geometry()
+                stats.segments_per_second = len(geometry) / stats.phases['draw'] if stats.phases['draw'] > 0 else None
+                self._finish_drawing(self._stats_message(stats), 'green')
+            return
+
+        # Draw the shared geometry in place, as it is already centered
+        self.turtle.hideturtle()
+        self.geometry = geometry
+
+        def progress(renderer : CanvasRenderer):
+            self.textbox_var.set(f'Drawing fractal...\n{renderer.segments_drawn} of {len(renderer.geometry)} segments')
+
+        def done(renderer : CanvasRenderer):
+            stats.record('render', renderer.time_elapsed)
+            stats.segments_per_second = renderer.segments_per_second()
+            self._finish_drawing(self._stats_message(stats), 'green')
+
+        self._index_geometry()
+        self._render_viewport(on_progress = progress, on_done = done)
+
+    def _index_geometry(self):
+        """Reads the spatial index of every level of detail that the engine built alongside the shared geometry, in place"""
+        self.detail = DetailLevels(self.shared.geometry, Window.min_segment_length, arrays = self.shared.index.arrays)
+
+    def _render_viewport(self, on_progress = None, on_done = None):
+        """Starts drawing the segments within the visible canvas, simplified for the current zoom"""
+        scale = self.view_scale
+        left, top = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        right, bottom = self.canvas.canvasx(self.canvas.winfo_width()), self.canvas.canvasy(self.canvas.winfo_height())
+        visible = self.detail.grid(scale).visible((left - self.view_x) / scale, (self.view_y - bottom) / scale,
+                                                  (right - self.view_x) / scale, (self.view_y - top) / scale)
+
+        # The renderer flips the y axis, so the vertical offset is negated
+        self.renderer = CanvasRenderer(self.canvas, visible.transformed(scale, self.view_x, -self.view_y), on_progress = on_progress, on_done = on_done)
+        self.renderer.start()
+
+    def _stats_message(self, stats : DrawStats) -> str:
+        message = f'Done in {round(stats.total(), 8)} sec\n{stats.sequence_length} character sequence\n{stats.segments} segments'
+        if stats.segments_per_second:
+            message += f', {round(stats.segments_per_second)} segments/sec'
+        if stats.peak_memory is not None:
+            message += f'\nPeak memory: {stats.peak_memory // 2**20} MB'
+        return message + f'\nSlowest phase: {stats.bottleneck()}'
+
+    def _finish_drawing(self, message : str, color : str):
+        self.textbox_label.configure(fg = color)
+        self.textbox_var.set(message)
+        self._bind_navigation()
         self.screen.update()
         self.draw_button.configure(state = 'normal')
 
+    def _bind_navigation(self):
+        self.canvas.bind('<ButtonPress-1>', self._scroll_start)
+        self.canvas.bind('<B1-Motion>', self._scroll_move)
+        self.canvas.bind('<MouseWheel>', self._mouse_scroll)
+
     def _reset_fractal(self):
         self.turtle.active = False
+        if self.job is not None:
+            self.engine.cancel(self.job)
+            self.job = None
+            self._finish_drawing('ERROR: Fractal generation forcibly stopped', 'red')
+        if self.redraw_job is not None:
+            self.canvas.after_cancel(self.redraw_job)
+            self.redraw_job = None
+        if self.renderer is not None:
+            # Only the initial draw reports when it is done; viewport redraws stop silently
+            if self.renderer.active and self.renderer.on_done is not None:
+                self._finish_drawing('ERROR: Fractal generation forcibly stopped', 'red')
+            self.renderer.cancel()
+            self.renderer = None
+        self.geometry = None
+        self.detail = None
+        self._release_geometry()
+        self._reset_view()
         self.screen.reset()
 
+    def _release_geometry(self):
+        """Frees the shared memory of the last generated geometry"""
+        if self.shared is not None:
+            self.shared.release()
+            self.shared = None
+
+    def _reset_view(self):
+        """Resets the zoom and the canvas position of the geometry origin"""
+        self.view_scale = 1.0
+        self.view_x = 0.0
+        self.view_y = 0.0
+
     def _save_fractal_popup(self):
         # Create popup window
         self.save_popup = tk.Toplevel()
@@ -249,27 +414,22 @@ class Window():
         self.save_message.grid(row = 3, column = 0, columnspan = 2)
 
     def _save_fractal(self, overwrite = False):
-        directory = Window.fractals_directory
         fractal_name = ' '.join([word.capitalize() for word in self.save_entry.get().split(' ')])
-        filename = directory + '\\' + fractal_name + '.json'
 
-        print(filename)
         if fractal_name.replace(' ', '') == '':
             self.save_message.configure(text = 'You cannot leave the name blank')
-        elif path.exists(filename) and not overwrite:
+        elif fractal_name in self.catalog and not overwrite:
             self.save_message.configure(text = 'This fractal already exists.\nWould you like to overwrite its contents?')
             self.save_entry.configure(state = tk.DISABLED)
             self.save_button1.configure(text = 'Yes', command = lambda : self._save_fractal(overwrite = True))
             self.save_button2.configure(text = 'No', command = self.save_fractal_cancel_overwrite)
         else:
-            # Dump fractal tuple to json file
-            with open(filename, mode = 'w') as f:
-                fractal = self._generate_fractal()
-                dump(fractal.get_tuple(), f)
+            # Save fractal tuple to catalog
+            fractal = self._generate_fractal()
+            self.catalog.save(fractal_name, fractal.get_tuple())
 
-            # Update fractals menu TODO: update menu to show new fractals
-            fractal_dict = self._generate_fractals_dictionary()
-            self.fractal_menu = tk.OptionMenu(self.editor_frame, self.fractal_var, *list(fractal_dict.keys()))
+            # Update fractals menu
+            self._update_fractals_menu()
 
             # Destroy popup window  
             self.save_popup.destroy()
@@ -285,20 +445,18 @@ class Window():
         self.save_button2.configure(text = 'Cancel', command = self.save_popup.destroy)
 
     def _save_image(self):
+        if self.geometry is None:
+            self.textbox_label.configure(fg = 'orange')
+            self.textbox_var.set('INVALID: Draw a fractal before saving an image')
+            return
+
         image_id = datetime.datetime.now().strftime('%m%d%y_%H.%M.%S.%f')[:-4]
-        image_eps = f'images/frac_{image_id}.eps'
         image_png = f'images/frac_{image_id}.png'
 
-        self.screen.getcanvas().postscript(file=image_eps)
-
-        try:
-            im = Image.open(image_eps).convert('RGBA')
-            im.save(image_png, lossless=True)
-        except OSError:
-            self.textbox_var.set(f'Saved image as:\n{image_eps}\nConfigure Ghostscipt to save as PNG')
-        else:
-            remove(image_eps)
-            self.textbox_var.set(f'Saved image as:\n{image_png}')
+        image = rasterize(self.geometry, Window.image_size, Window.image_size)
+        image.save(image_png)
+        self.textbox_label.configure(fg = 'black')
+        self.textbox_var.set(f'Saved image as:\n{image_png}')
 
     # TODO: IMPROVE
     def _update_alphabet_entry(self, *_):
@@ -353,16 +511,54 @@ class Window():
         entry.icursor(index)
 
     def _scroll_start(self, event):
-        self.canvas.scan_mark(event.x, event.y)
-        print('scroll start')
+        self.drag_x, self.drag_y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
 
     def _scroll_move(self, event):
-        self.canvas.scan_dragto(event.x, event.y, gain=1)
-        print('scroll move')
+        if self.detail is None:
+            return
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        dx, dy = x - self.drag_x, y - self.drag_y
+        self.drag_x, self.drag_y = x, y
+        self.view_x += dx
+        self.view_y += dy
+
+        # Move only what is already drawn until the viewport is redrawn
+        self._stop_drawing()
+        self.canvas.move(CanvasRenderer.tag, dx, dy)
+        self._schedule_redraw()
 
     def _mouse_scroll(self, event):
+        if self.detail is None:
+            return
         amount = 0.9 if event.delta < 0 else 1.1
-        self.canvas.scale(tk.ALL, 0, 0, amount, amount)
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        self.view_scale *= amount
+        self.view_x = x + (self.view_x - x) * amount
+        self.view_y = y + (self.view_y - y) * amount
+
+        # Scale only what is already drawn until the viewport is redrawn
+        self._stop_drawing()
+        self.canvas.scale(CanvasRenderer.tag, x, y, amount, amount)
+        self._schedule_redraw()
+
+    def _stop_drawing(self):
+        """Clears a turtle drawing, which is replaced by rendered geometry, and partial redraws, which would be misplaced once moved"""
+        if self.renderer is None:
+            self.turtle.clear()
+        elif self.renderer.active:
+            self.renderer.cancel()
+
+    def _schedule_redraw(self):
+        """Redraws the viewport once navigation pauses for the redraw delay"""
+        if self.redraw_job is not None:
+            self.canvas.after_cancel(self.redraw_job)
+        self.redraw_job = self.canvas.after(Window.redraw_delay, self._redraw_viewport)
+
+    def _redraw_viewport(self):
+        self.redraw_job = None
+        if self.renderer is not None:
+            self.renderer.cancel()
+        self._render_viewport()
 
 if __name__ == '__main__':
     gui = Window()
\ No newline at end of file
@@ -0,0 +1,81 @@
+from bounds import extent
+from fractals import LFractal
+from rewriting import Node, rewrite_tree
+from vector import _number
+
+def instance(fractal : LFractal, iterations : int) -> Node:
+    """Returns the root node of the rewrite tree of the fractal, dropping its moves and the children that draw nothing
+
+    The number of nodes grows with the iterations rather than the length of the sequence. Raises
+    Unbalanced if a production rule does not restore the positions it saves.
+    """
+    pruned = {}
+
+    def prune(node : Node) -> Node:
+        if node.key not in pruned:
+            instances = [(prune(child), x, y, turn) for child, x, y, turn in node.instances if child.segments]
+            pruned[node.key] = Node(node.key, node.strokes, [], instances, node.end_x, node.end_y, node.turn)
+        return pruned[node.key]
+
+    return prune(rewrite_tree(fractal, iterations))
+
+def nodes(root : Node) -> list:
+    """Returns every node that draws something below and including the root, children before their parents"""
+    ordered = []
+    seen = set()
+
+    def visit(node : Node):
+        if id(node) in seen:
+            return
+        seen.add(id(node))
+        for child, _, _, _ in node.instances:
+            visit(child)
+        ordered.append(node)
+
+    visit(root)
+    return ordered
+
+def write_instanced_svg(fractal : LFractal, iterations : int, file, unit = 1.0, size = 1024, stroke = 'black', stroke_width = 1, margin = 0.05) -> Node:
+    """Writes the fractal into a binary file as SVG, defining the shape of each node once and placing it with <use>; returns the root node
+
+    Raises Unbalanced before writing anything if the fractal cannot be instanced.
+    """
+    root = instance(fractal, iterations)
+    min_x, min_y, max_x, max_y = extent(fractal, iterations, unit)[:4]
+    pad = max(max_x - min_x, max_y - min_y, unit) * margin
+    view_box = f'{_number(min_x - pad)} {_number(-max_y - pad)} {_number(max_x - min_x + 2 * pad)} {_number(max_y - min_y + 2 * pad)}'
+    shapes = nodes(root)
+    ids = {id(node) : f'n{index}' for index, node in enumerate(shapes)}
+    degrees = float(fractal.angle())
+
+    file.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+    file.write(f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{size}" height="{size}" viewBox="{view_box}">\n'
+               f'<style>path {{ vector-effect: non-scaling-stroke; }}</style>\n<defs>\n'.encode('ascii'))
+    for node in shapes[:-1]:
+        file.write(f'<g id="{ids[id(node)]}">{_shape(node, ids, degrees)}</g>\n'.encode('ascii'))
+
+    # Flip the y axis once, so every shape is defined with the y axis pointing up
+    file.write(f'</defs>\n<g fill="none" stroke="{stroke}" stroke-width="{stroke_width}" stroke-linecap="round" '
+               f'stroke-linejoin="round" transform="scale({_number(unit, 9)} {_number(-unit, 9)})">{_shape(root, ids, degrees)}</g>\n</svg>\n'.encode('ascii'))
+    return root
+
+def _shape(node : Node, ids : dict, degrees : float) -> str:
+    parts = []
+    if node.strokes:
+        commands = []
+        position = None
+        for x0, y0, x1, y1 in node.strokes:
+            if position != (x0, y0):
+                commands.append(f'M{_number(x0, 9)} {_number(y0, 9)}')
+            commands.append(f'L{_number(x1, 9)} {_number(y1, 9)}')
+            position = (x1, y1)
+        parts.append(f'<path d="{"".join(commands)}"/>')
+    for child, x, y, turn in node.instances:
+        transform = []
+        if (_number(x, 9), _number(y, 9)) != ('0', '0'):
+            transform.append(f'translate({_number(x, 9)} {_number(y, 9)})')
+        if turn:
+            transform.append(f'rotate({_number(turn * degrees % 360, 9)})')
+        placement = f' transform="{" ".join(transform)}"' if transform else ''
+        parts.append(f'<use xlink:href="#{ids[id(child)]}"{placement}/>')
+    return ''.join(parts)
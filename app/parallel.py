@@ -0,0 +1,112 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from geometry import Geometry, State, directions, join, period, walk, OP_DRAW, OP_MOVE, OP_RIGHT, OP_LEFT, OP_SAVE, OP_LOAD
+
+class Transform():
+    """Effect of walking a chunk of a program, relative to the state it starts from
+
+    The chunk pops pops saved states it did not push, then ends at (x, y, heading) with the positions in saves
+    left open. These are relative to the last state it popped, or to its starting state if it pops none.
+    """
+
+    def __init__(self, pops : int, x : float, y : float, heading : int, saves : list):
+        self.pops = pops
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.saves = saves
+
+    def apply(self, state : State, rotations : np.ndarray, turns : int) -> State:
+        """Returns the state after walking the chunk from the given state"""
+        remaining = len(state.stack) - self.pops
+        if remaining < 0:
+            raise IndexError('pop from empty list')
+        root = State(*state.stack[remaining]) if self.pops else state
+        cos, sin = rotations[root.heading]
+
+        def place(x : float, y : float, heading : int) -> tuple:
+            return (root.x + cos * x - sin * y, root.y + sin * x + cos * y, (root.heading + heading) % turns)
+
+        return State(*place(self.x, self.y, self.heading), state.stack[:remaining] + [place(*entry) for entry in self.saves])
+
+def summarize(program : bytes, angle, unit = 1.0) -> Transform:
+    """Returns the transform of a chunk of a program from the sums of its turns and moves, without walking its segments
+
+    Only ops after the last LOAD of a state the chunk did not save, and outside brackets it closes, affect where it ends.
+    """
+    ops = np.frombuffer(program, dtype = np.uint8)
+    is_save = ops == OP_SAVE
+    is_load = ops == OP_LOAD
+    lowest = 0
+    kept = np.ones(len(ops), dtype = bool)
+    if is_save.any() or is_load.any():
+        depth = np.cumsum(is_save.astype(np.int64) - is_load)
+        lowest = min(int(depth.min()), 0)
+        start = int(np.argmax(depth == lowest)) + 1 if lowest < 0 else 0
+        ops, depth, is_save = ops[start:], depth[start:], is_save[start:]
+
+        # Keep ops whose depth no later op goes below, as everything else is undone by a later LOAD
+        later = np.append(np.minimum.accumulate(depth[::-1])[::-1][1:], np.iinfo(np.int64).max)
+        kept = depth <= later
+    if not len(ops):
+        return Transform(-lowest, 0.0, 0.0, 0, [])
+
+    turns = (ops == OP_LEFT).view(np.int8) - (ops == OP_RIGHT).view(np.int8)
+    headings = np.cumsum(turns if kept.all() else np.where(kept, turns, 0), dtype = np.int64) % period(angle)
+    saves = np.flatnonzero(kept & is_save)
+
+    # Add up the moves between consecutive open saves
+    moved = np.flatnonzero(kept & ((ops == OP_DRAW) | (ops == OP_MOVE)))
+    section = np.searchsorted(saves, moved)
+    steps = directions(angle, unit)[headings[moved]]
+    xs = np.cumsum(np.bincount(section, steps[:, 0], len(saves) + 1))
+    ys = np.cumsum(np.bincount(section, steps[:, 1], len(saves) + 1))
+    return Transform(-lowest, float(xs[-1]), float(ys[-1]), int(headings[-1]),
+                     [(float(xs[i]), float(ys[i]), int(headings[save])) for i, save in enumerate(saves)])
+
+def parallel_walk(chunks, angle, unit = 1.0, state = None, workers = None, executor = None, token = None, progress = None, out = None, window = 16) -> tuple:
+    """Walks the chunks of a program in worker processes; returns their joined Geometry and the final State
+
+    Chunks are taken window at a time, so only that many are held at once. The chunks of each window are summarized
+    as Transforms in parallel, the transforms are composed in order to find the state every chunk starts from, and
+    the chunks are walked again in parallel from those states.
+    If out is given, segments are written into it as they are walked; it must be an (n, 4) array of exactly the segments drawn.
+    The token is checked and progress(segments) is called as each chunk is walked.
+    """
+    state = state if state is not None else State()
+    if executor is None:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            return parallel_walk(chunks, angle, unit, state, executor = executor, token = token, progress = progress, out = out, window = window)
+
+    rotations = directions(angle)
+    turns = period(angle)
+    chunks = iter(chunks)
+    parts = []
+    segments = 0
+    while True:
+        batch = list(islice(chunks, window))
+        if not batch:
+            break
+
+        # Compose the transforms of the chunks to find where each one starts
+        starts = [state]
+        for transform in executor.map(summarize, batch, repeat(angle), repeat(unit)):
+            if token is not None:
+                token.check()
+            starts.append(transform.apply(starts[-1], rotations, turns))
+
+        for part, state in executor.map(walk, batch, repeat(angle), repeat(unit), starts[:-1]):
+            if token is not None:
+                token.check()
+            if out is not None:
+                # Copy into the preallocated segments and keep a view of them instead
+                out[segments:segments + len(part)] = part.segments
+                part = Geometry(out[segments:segments + len(part)], part.bounds, part.max_depth)
+            parts.append(part)
+            segments += len(part)
+            if progress is not None:
+                progress(segments)
+    if out is not None and segments != len(out):
+        raise ValueError(f'Expected {len(out)} segments but walked {segments}')
+    return join(parts, out), state
@@ -0,0 +1,89 @@
+from os import cpu_count
+from fractals import LFractal, SequenceTooLong, counts
+
+class Plan():
+    """Exact sizes of a fractal expanded to some number of iterations, and the strategy chosen to generate its geometry
+
+    The strategy is MATERIALIZE to expand the whole sequence, STREAM to walk it as it is compiled, PARALLEL to
+    walk chunks of it in worker processes, or REFUSE if its geometry would not fit in memory.
+    """
+
+    MATERIALIZE = 'materialize'
+    STREAM = 'stream'
+    PARALLEL = 'parallel'
+    REFUSE = 'refuse'
+
+    # Define bytes of each segment and its pen-up break index
+    SEGMENT_BYTES = 4 * 8 + 8
+
+    # Define shortest program worth walking in parallel
+    PARALLEL_LENGTH = 16 * LFractal.CHUNK_SIZE
+
+    def __init__(self, iterations : int, sequence_length : int, program_length : int, segments : int, max_depth : int):
+        self.iterations = iterations
+        self.sequence_length = sequence_length
+        self.program_length = program_length
+        self.segments = segments
+        self.max_depth = max_depth
+        self.geometry_bytes = segments * Plan.SEGMENT_BYTES
+        self.strategy = Plan.MATERIALIZE
+        self.workers = None
+
+    @property
+    def stream(self) -> bool:
+        """Returns whether the program must be streamed rather than expanded, as it is beyond max_sequence when walked in parallel too"""
+        return self.strategy in (Plan.STREAM, Plan.PARALLEL)
+
+    def check(self):
+        """Raises SequenceTooLong if the plan was refused"""
+        if self.strategy == Plan.REFUSE:
+            raise SequenceTooLong(f'Fractal geometry of {self.segments} segments needs {self.geometry_bytes // 2**20} MiB')
+
+def max_depth(fractal : LFractal, iterations : int) -> int:
+    """Returns the deepest stack of saved positions while walking the fractal after the given number of iterations, without expanding it"""
+    # Summarize each symbol at each depth as the net change and highest point of the stack depth over its expansion
+    leaves = {LFractal.SAVE : (1, 1), LFractal.LOAD : (-1, 0)}
+    summaries = {symbol : leaves.get(fractal.functions.get(symbol), (0, 0)) for symbol in fractal.rules}
+    for _ in range(iterations):
+        next_summaries = {}
+        for symbol, rule in fractal.rules.items():
+            depth = highest = 0
+            for child in rule:
+                net, child_highest = summaries[child]
+                highest = max(highest, depth + child_highest)
+                depth += net
+            next_summaries[symbol] = (depth, highest)
+        summaries = next_summaries
+
+    depth = highest = 0
+    for symbol in fractal.axiom():
+        net, symbol_highest = summaries[symbol]
+        highest = max(highest, depth + symbol_highest)
+        depth += net
+    return highest
+
+def plan(fractal : LFractal, iterations : int, max_sequence = 2000000, max_bytes = 2**30, workers = None) -> Plan:
+    """Returns the exact sizes of the fractal after the given number of iterations and the strategy to generate its geometry
+
+    Sequences up to max_sequence characters are materialized. Longer ones are walked in parallel with the given
+    number of workers, or all cores, if long enough, and streamed otherwise. Geometry beyond max_bytes is refused.
+    """
+    symbol_counts = counts(fractal, iterations)
+    opcodes = {symbol for symbol, function in fractal.functions.items() if function in LFractal.OPCODES}
+    draws = {symbol for symbol, function in fractal.functions.items() if function == LFractal.DRAW}
+    result = Plan(iterations, sum(symbol_counts.values()),
+                  sum(count for symbol, count in symbol_counts.items() if symbol in opcodes),
+                  sum(count for symbol, count in symbol_counts.items() if symbol in draws),
+                  max_depth(fractal, iterations))
+
+    workers = cpu_count() if workers is None else workers
+    if result.geometry_bytes > max_bytes:
+        result.strategy = Plan.REFUSE
+    elif result.sequence_length <= max_sequence:
+        result.strategy = Plan.MATERIALIZE
+    elif workers and workers > 1 and result.program_length >= Plan.PARALLEL_LENGTH:
+        result.strategy = Plan.PARALLEL
+        result.workers = workers
+    else:
+        result.strategy = Plan.STREAM
+    return result
@@ -0,0 +1,94 @@
+import numpy as np
+from PIL import Image, ImageDraw
+from geometry import Geometry, State, walk
+from simplify import simplify as simplify_geometry
+
+def rasterize(geometry : Geometry, width : int, height : int, line_width = 1, color = 'black', background = 'white',
+              margin = 0.05, antialias = 4, band_height = 256, simplify = False, min_pixels = 1.0) -> Image.Image:
+    """Returns an image of the geometry scaled to fit within the given size, without using Tk
+
+    The image is drawn in horizontal bands so memory stays proportional to the width of the image.
+    Each band is drawn at antialias times the resolution and reduced to smooth its lines.
+    If simplify is set, duplicate and collinear segments are merged and runs shorter than min_pixels pixels are culled first.
+    """
+    image = Image.new('RGBA' if background is None else 'RGB', (width, height), background or (0, 0, 0, 0))
+    if not len(geometry):
+        return image
+
+    scale = geometry.fit(width * (1 - 2 * margin), height * (1 - 2 * margin))
+    if simplify:
+        geometry = simplify_geometry(geometry, min_length = min_pixels / scale)
+    segments = _to_pixels(geometry.segments, geometry.center(), scale, width, height)
+
+    factor = max(int(antialias), 1)
+    stroke = max(int(round(line_width * factor)), 1)
+    pad = stroke / factor
+    top_y = np.minimum(segments[:, 1], segments[:, 3])
+    bottom_y = np.maximum(segments[:, 1], segments[:, 3])
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+        visible = (bottom_y >= top - pad) & (top_y <= bottom + pad)
+        if not visible.any():
+            continue
+
+        # Draw band coverage at full resolution and use it to paint the line color
+        band = Geometry(segments[visible], (0, 0, 0, 0))
+        mask = Image.new('L', (width * factor, (bottom - top) * factor), 0)
+        draw = ImageDraw.Draw(mask)
+        offset = np.array([0, top])
+        for polyline in band.polylines():
+            points = (polyline.reshape(-1, 2) - offset) * factor
+            draw.line(points.ravel().tolist(), fill = 255, width = stroke)
+        if factor > 1:
+            mask = mask.reduce(factor)
+        image.paste(color, (0, top, width, bottom), mask)
+
+    return image
+
+def rasterize_program(program, angle, bounds : tuple, width : int, height : int, unit = 1.0, line_width = 1, color = 'black',
+                      background = 'white', margin = 0.05, antialias = 4, max_mask_bytes = 2**26) -> Image.Image:
+    """Returns an image of a compiled program walked chunk by chunk, scaled so the given bounds fit within the given size
+
+    The program is a function returning an iterable of program chunks, such as program_chunks, and only the geometry
+    of one chunk is held at a time. The image is drawn in bands at antialias times the resolution and reduced to smooth
+    its lines. Each band is as tall as fits a mask of max_mask_bytes and walks the program again, so memory stays
+    bounded whatever the size of the image or the fractal.
+    """
+    image = Image.new('RGBA' if background is None else 'RGB', (width, height), background or (0, 0, 0, 0))
+    frame = Geometry(np.zeros((0, 4)), bounds)
+    scale = frame.fit(width * (1 - 2 * margin), height * (1 - 2 * margin))
+    center = frame.center()
+
+    factor = max(int(antialias), 1)
+    stroke = max(int(round(line_width * factor)), 1)
+    pad = stroke / factor
+    band_height = max(max_mask_bytes // (width * factor * factor), 1)
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+
+        # Draw band coverage at full resolution from a new walk of the program and use it to paint the line color
+        mask = Image.new('L', (width * factor, (bottom - top) * factor), 0)
+        draw = ImageDraw.Draw(mask)
+        offset = np.array([0, top])
+        state = State()
+        for chunk in program():
+            geometry, state = walk(chunk, angle, unit, state)
+            segments = _to_pixels(geometry.segments, center, scale, width, height)
+            visible = (np.maximum(segments[:, 1], segments[:, 3]) >= top - pad) & (np.minimum(segments[:, 1], segments[:, 3]) <= bottom + pad)
+            if not visible.any():
+                continue
+            for polyline in Geometry(segments[visible], bounds).polylines():
+                points = (polyline.reshape(-1, 2) - offset) * factor
+                draw.line(points.ravel().tolist(), fill = 255, width = stroke)
+        if factor > 1:
+            mask = mask.reduce(factor)
+        image.paste(color, (0, top, width, bottom), mask)
+    return image
+
+def _to_pixels(segments : np.ndarray, center : tuple, scale : float, width : int, height : int) -> np.ndarray:
+    # Transform segments into pixel coordinates with the y axis pointing down
+    center_x, center_y = center
+    segments = segments - (center_x, center_y, center_x, center_y)
+    segments *= (scale, -scale, scale, -scale)
+    segments += (width / 2, height / 2, width / 2, height / 2)
+    return segments
@@ -0,0 +1,61 @@
+import tkinter as tk
+from time import time
+from geometry import Geometry
+
+class CanvasRenderer():
+    """Draws fractal geometry directly onto a Tk canvas as polylines, in chunks between Tk events"""
+
+    tag = 'fractal'
+
+    def __init__(self, canvas : tk.Canvas, geometry : Geometry, color = 'black', width = 1,
+                 time_slice = 0.02, max_points = 4096, on_progress = None, on_done = None):
+        self.canvas = canvas
+        self.geometry = geometry
+        self.color = color
+        self.width = width
+        self.time_slice = time_slice
+        self.max_points = max_points
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.active = False
+        self.segments_drawn = 0
+        self.time_elapsed = 0
+
+    def start(self):
+        """Clears previously rendered geometry and starts drawing in chunks"""
+        self.canvas.delete(CanvasRenderer.tag)
+        self._polylines = self.geometry.polylines(self.max_points)
+        self.active = True
+        self.segments_drawn = 0
+        self._start = time()
+        self._job = self.canvas.after_idle(self._render_chunk)
+
+    def cancel(self):
+        """Stops drawing and removes rendered geometry from the canvas"""
+        if self.active:
+            self.canvas.after_cancel(self._job)
+            self.active = False
+        self.canvas.delete(CanvasRenderer.tag)
+
+    def segments_per_second(self) -> float:
+        """Returns the drawing throughput of the renderer"""
+        return self.segments_drawn / self.time_elapsed if self.time_elapsed > 0 else 0.0
+
+    def _render_chunk(self):
+        deadline = time() + self.time_slice
+        for polyline in self._polylines:
+            # Flip y axis to match turtle coordinates
+            polyline[1::2] *= -1
+            self.canvas.create_line(polyline.tolist(), fill = self.color, width = self.width, tags = CanvasRenderer.tag)
+            self.segments_drawn += len(polyline) // 2 - 1
+            if time() > deadline:
+                self.time_elapsed = time() - self._start
+                if self.on_progress:
+                    self.on_progress(self)
+                self._job = self.canvas.after(1, self._render_chunk)
+                return
+
+        self.active = False
+        self.time_elapsed = time() - self._start
+        if self.on_done:
+            self.on_done(self)
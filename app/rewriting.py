@@ -0,0 +1,85 @@
+from fractals import LFractal
+from geometry import directions, period
+
+class Unbalanced(Exception):
+    """Raised when a symbol's expansion saves or loads positions it does not restore itself"""
+
+class Node():
+    """Shape drawn by a symbol expanded to some depth, starting at the origin facing heading 0
+
+    The shape is made of strokes drawn and moves made directly, and instances of child nodes placed at (x, y) and
+    rotated by whole turns of the angle. It ends at (end_x, end_y) having turned turn times, and draws segments in total.
+    """
+
+    def __init__(self, key : tuple, strokes : list, moves : list, instances : list, end_x : float, end_y : float, turn : int):
+        self.key = key
+        self.strokes = strokes
+        self.moves = moves
+        self.instances = instances
+        self.end_x = end_x
+        self.end_y = end_y
+        self.turn = turn
+        self.segments = len(strokes) + sum(child.segments for child, _, _, _ in instances)
+
+def rewrite_tree(fractal : LFractal, iterations : int) -> Node:
+    """Returns the root node of the rewrite tree of the fractal, sharing one node for each symbol and depth among all its parents
+
+    Each node is built once from the nodes of its production rule, so the number of nodes grows with the
+    iterations rather than the length of the sequence. Raises Unbalanced if a production rule does not
+    restore the positions it saves.
+    """
+    steps = directions(fractal.angle()).tolist()
+    turns = period(fractal.angle())
+    nodes = {}
+
+    def is_leaf(symbol : str, depth : int) -> bool:
+        return depth == 0 or fractal.rules.get(symbol, symbol) == symbol
+
+    def node(symbol : str, depth : int) -> Node:
+        key = (symbol, depth)
+        if key not in nodes:
+            nodes[key] = compose(fractal.rules[symbol], depth - 1, key, True)
+        return nodes[key]
+
+    def compose(symbols : str, depth : int, key : tuple, strict : bool) -> Node:
+        """Returns the node of the symbols, each expanded depth times"""
+        x = y = 0.0
+        turn = 0
+        stack = []
+        strokes = []
+        moves = []
+        instances = []
+        for symbol in symbols:
+            if not is_leaf(symbol, depth):
+                # Place the child node and continue from its end
+                child = node(symbol, depth)
+                instances.append((child, x, y, turn % turns))
+                cos, sin = steps[turn % turns]
+                x, y = x + cos * child.end_x - sin * child.end_y, y + sin * child.end_x + cos * child.end_y
+                turn += child.turn
+                continue
+
+            function = fractal.functions.get(symbol)
+            if function == LFractal.DRAW or function == LFractal.MOVE:
+                dx, dy = steps[turn % turns]
+                (strokes if function == LFractal.DRAW else moves).append((x, y, x + dx, y + dy))
+                x += dx
+                y += dy
+            elif function == LFractal.LEFT:
+                turn += 1
+            elif function == LFractal.RIGHT:
+                turn -= 1
+            elif function == LFractal.SAVE:
+                stack.append((x, y, turn))
+            elif function == LFractal.LOAD:
+                if stack:
+                    x, y, turn = stack.pop()
+                elif strict:
+                    raise Unbalanced(symbol)
+                else:
+                    raise IndexError('pop from empty list')
+        if stack and strict:
+            raise Unbalanced(symbols)
+        return Node(key, strokes, moves, instances, x, y, turn)
+
+    return compose(fractal.axiom(), iterations, ('', iterations), False)
@@ -0,0 +1,191 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+from io import BytesIO
+from json import dumps, loads
+from math import isfinite
+from cli import FORMATS, render
+from fractals import LFractal, symbol_functions
+from geometry import period
+from planning import counts
+
+"""
+Local HTTP render service
+
+POST a JSON object to /render with the fractal in the get_tuple format and optionally its iterations, size and format:
+    {"fractal" : [alphabet, functions, rules, axiom, angle], "iterations" : 4, "size" : 1024, "format" : "png"}
+The response body is the rendered file.
+"""
+
+CONTENT_TYPES = {'png' : 'image/png', 'svg' : 'image/svg+xml', 'seg' : 'application/octet-stream'}
+REASONS = {200 : 'OK', 400 : 'Bad Request', 404 : 'Not Found', 405 : 'Method Not Allowed', 413 : 'Payload Too Large', 500 : 'Internal Server Error'}
+
+class BadRequest(Exception):
+    """Raised when a render request is malformed or exceeds the limits of the service"""
+
+    def __init__(self, message : str, status = 400):
+        super().__init__(message)
+        self.status = status
+
+def render_bytes(fractal_tuple : tuple, iterations : int, size : int, format : str, max_sequence : int) -> bytes:
+    """Renders a fractal tuple in the given format; returns the rendered file"""
+    fractal = LFractal()
+    fractal.load_tuple(fractal_tuple)
+    file = BytesIO()
+    render(fractal, iterations, size, format, file, max_sequence)
+    return file.getvalue()
+
+class RenderService():
+    """Renders fractals requested over HTTP in a process pool, sharing identical concurrent renders and caching results by content hash
+
+    Cached results are evicted least recently used first once they exceed max_bytes.
+    """
+
+    max_body = 2**20
+    max_size = 8192
+    max_iterations = 64
+    max_period = 360000
+
+    def __init__(self, workers = None, max_bytes = 256 * 2**20, max_sequence = 2000000):
+        self.executor = ProcessPoolExecutor(max_workers = workers)
+        self.max_bytes = max_bytes
+        self.max_sequence = max_sequence
+        self.results = OrderedDict()
+        self.size = 0
+        self.pending = {}
+
+    @staticmethod
+    def key(fractal_tuple : tuple, iterations : int, size : int, format : str) -> str:
+        """Returns a hash of the render request"""
+        return sha1(dumps([fractal_tuple, iterations, size, format], sort_keys = True).encode('utf-8')).hexdigest()
+
+    async def render(self, fractal_tuple : tuple, iterations : int, size : int, format : str) -> bytes:
+        """Returns the rendered file, from the cache, from an identical render in progress, or from a new render"""
+        key = RenderService.key(fractal_tuple, iterations, size, format)
+        if key in self.results:
+            self.results.move_to_end(key)
+            return self.results[key]
+        if key not in self.pending:
+            loop = asyncio.get_running_loop()
+            self.pending[key] = loop.run_in_executor(self.executor, render_bytes, fractal_tuple, iterations, size, format, self.max_sequence)
+            self.pending[key].add_done_callback(lambda future : self._finish(key, future))
+        return await asyncio.shield(self.pending[key])
+
+    def parse(self, body : bytes) -> tuple:
+        """Returns the fractal tuple, iterations, size and format of a render request body, checking every field so renders only fail on the server's side"""
+        try:
+            request = loads(body)
+            alphabet, functions, rules, axiom, angle = request['fractal']
+            iterations = request.get('iterations', 4)
+            size = request.get('size', 1024)
+            format = request.get('format', 'png')
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise BadRequest(f'Invalid render request: {e!r}')
+
+        def is_integer(value) -> bool:
+            return isinstance(value, int) and not isinstance(value, bool)
+
+        def is_symbol(value) -> bool:
+            return isinstance(value, str) and len(value) == 1
+
+        if not isinstance(alphabet, list) or not all(map(is_symbol, alphabet)):
+            raise BadRequest('Alphabet must be a list of single characters')
+        if not isinstance(functions, dict) or not all(is_symbol(symbol) and function in symbol_functions() + [''] for symbol, function in functions.items()):
+            raise BadRequest(f'Functions must map single characters to one of {", ".join(symbol_functions())} or an empty string')
+        if not isinstance(rules, dict) or not all(is_symbol(symbol) and isinstance(rule, str) for symbol, rule in rules.items()) or not isinstance(axiom, str):
+            raise BadRequest('Rules must map single characters to strings and the axiom must be a string')
+        undefined = set(axiom).union(*rules.values()) - (set(rules) & set(alphabet))
+        if undefined:
+            raise BadRequest(f'Production rules not defined for {" ".join(sorted(undefined))}')
+        if not isinstance(angle, (int, float)) or isinstance(angle, bool) or not isfinite(angle) or period(angle) > RenderService.max_period:
+            raise BadRequest(f'Angle must be a number of degrees repeating within {RenderService.max_period} turns')
+        if format not in FORMATS:
+            raise BadRequest(f'Unknown format {format}')
+        if not is_integer(iterations) or not 0 <= iterations <= RenderService.max_iterations:
+            raise BadRequest(f'Iterations must be an integer between 0 and {RenderService.max_iterations}')
+        if not is_integer(size) or not 0 < size <= RenderService.max_size:
+            raise BadRequest(f'Size must be an integer between 1 and {RenderService.max_size}')
+
+        fractal_tuple = (alphabet, functions, rules, axiom, angle)
+        fractal = LFractal()
+        fractal.load_tuple(fractal_tuple)
+        if sum(counts(fractal, iterations).values()) > self.max_sequence:
+            raise BadRequest(f'Fractal sequence exceeded maximum of {self.max_sequence} characters', 413)
+        return fractal_tuple, iterations, size, format
+
+    async def handle(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        """Answers one HTTP request on the connection; errors of the render itself are answered with status 500"""
+        try:
+            status, content_type, body = await self._respond(reader)
+        except Exception as e:
+            status, content_type, body = 500, 'text/plain', f'ERROR: {e}'.encode('utf-8')
+
+        writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1'))
+        writer.write(body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host = '127.0.0.1', port = 8000):
+        """Serves render requests until cancelled"""
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures = True)
+
+    async def _respond(self, reader : asyncio.StreamReader) -> tuple:
+        # Read the request, then return the status, content type and body of the response
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length < 0:
+                raise ValueError(f'Negative Content-Length {length}')
+        except ValueError as e:
+            return 400, 'text/plain', f'Malformed HTTP request: {e}'.encode('utf-8')
+
+        if target.split('?')[0] != '/render':
+            return 404, 'text/plain', b'Not found'
+        if method != 'POST':
+            return 405, 'text/plain', b'Use POST'
+        if length > RenderService.max_body:
+            return 413, 'text/plain', b'Request body too large'
+        try:
+            request = self.parse(await reader.readexactly(length))
+        except asyncio.IncompleteReadError as e:
+            return 400, 'text/plain', f'Malformed HTTP request: {e}'.encode('utf-8')
+        except BadRequest as e:
+            return e.status, 'text/plain', str(e).encode('utf-8')
+        return 200, CONTENT_TYPES[request[3]], await self.render(*request)
+
+    def _finish(self, key : str, future : asyncio.Future):
+        del self.pending[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        self.results[key] = result
+        self.size += len(result)
+        while self.size > self.max_bytes and len(self.results) > 1:
+            _, evicted = self.results.popitem(last = False)
+            self.size -= len(evicted)
+
+def serve_command(args) -> int:
+    service = RenderService(args.jobs, args.cache_size * 2**20, args.max_sequence)
+    print(f'Serving fractal renders on http://{args.host}:{args.port}/render')
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
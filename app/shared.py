@@ -0,0 +1,267 @@
+import multiprocessing, struct
+import numpy as np
+from json import dumps, loads
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, util
+from multiprocessing.shared_memory import SharedMemory
+from shutil import rmtree
+from tempfile import mkdtemp
+from cache import ExpansionCache
+from fractals import LFractal, Cancelled
+from geometry import Geometry
+from spatial import DetailLevels
+from stats import DrawStats
+
+GEOMETRY_MAGIC = b'LGEO'
+GEOMETRY_VERSION = 1
+GEOMETRY_HEADER = struct.Struct('<4sIQQ4dQ')
+
+ARRAYS_MAGIC = b'LARR'
+ARRAYS_VERSION = 1
+ARRAYS_HEADER = struct.Struct('<4sIQ')
+
+class SharedGeometry():
+    """Geometry stored in a shared memory block and read in place as NumPy views
+
+    The block holds a header of the segment count, break count, bounds and deepest stack, then the
+    float64 segments and the int64 indices of segments that lift the pen. Views of the block must be
+    dropped before release can close it.
+
+    Blocks may be allocated for a known number of segments, written in place, and then finished.
+    Arrays built from the geometry, such as its DetailLevels, may be kept as index in a SharedArrays
+    block, which is closed and released along with it.
+    """
+
+    def __init__(self, memory : SharedMemory, index = None):
+        self.memory = memory
+        self.index = index
+        self._map()
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @staticmethod
+    def allocate(count : int):
+        """Returns a new shared memory block with room for count segments and as many breaks, which are only committed once written"""
+        memory = SharedMemory(create = True, size = GEOMETRY_HEADER.size + count * (4 * 8 + 8))
+        GEOMETRY_HEADER.pack_into(memory.buf, 0, GEOMETRY_MAGIC, GEOMETRY_VERSION, count, 0, 0.0, 0.0, 0.0, 0.0, 0)
+        return SharedGeometry(memory)
+
+    @staticmethod
+    def create(geometry : Geometry):
+        """Returns a new shared memory block holding a copy of the geometry"""
+        shared = SharedGeometry.allocate(len(geometry))
+        shared.segments[:] = geometry.segments
+        shared.finish(geometry.bounds, geometry.max_depth)
+        return shared
+
+    def finish(self, bounds : tuple, max_depth : int):
+        """Writes the breaks of the segments written in place, and the bounds and deepest stack of their geometry"""
+        breaks = Geometry(self.segments, bounds).breaks()
+        GEOMETRY_HEADER.pack_into(self.memory.buf, 0, GEOMETRY_MAGIC, GEOMETRY_VERSION, len(self.segments), len(breaks), *bounds, max_depth)
+        self._map()
+        self.breaks[:] = breaks
+
+    @staticmethod
+    def attach(name : str, index_name = None):
+        """Returns the shared geometry in the named block, with the index in the block named index_name if given"""
+        return SharedGeometry(SharedMemory(name), None if index_name is None else SharedArrays.attach(index_name))
+
+    def close(self):
+        """Unmaps the block from this process, leaving it for others"""
+        self.segments = self.breaks = self.geometry = None
+        if self.index is not None:
+            self.index.close()
+        self.memory.close()
+
+    def release(self):
+        """Frees the block once every process has closed it"""
+        if self.index is not None:
+            self.index.memory.unlink()
+        self.memory.unlink()
+        try:
+            self.close()
+        except BufferError:
+            # Views still in use keep the mapping alive until they are collected
+            pass
+
+    def _map(self):
+        magic, version, count, break_count, *bounds, max_depth = GEOMETRY_HEADER.unpack_from(self.memory.buf)
+        if magic != GEOMETRY_MAGIC or version != GEOMETRY_VERSION:
+            raise ValueError('Not a shared fractal geometry')
+        self.segments = np.ndarray((count, 4), np.float64, self.memory.buf, GEOMETRY_HEADER.size)
+        self.breaks = np.ndarray((break_count,), np.int64, self.memory.buf, GEOMETRY_HEADER.size + self.segments.nbytes)
+        self.geometry = Geometry(self.segments, tuple(bounds), max_depth, self.breaks)
+
+class SharedArrays():
+    """Named NumPy arrays stored in a shared memory block and read in place as views
+
+    The block holds a header of the length of a JSON table of the name, type, shape and offset of each
+    array, the table itself, then the arrays aligned to 8 bytes.
+    """
+
+    def __init__(self, memory : SharedMemory):
+        self.memory = memory
+        self._map()
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @staticmethod
+    def create(arrays : dict):
+        """Returns a new shared memory block holding a copy of the arrays"""
+        table = []
+        size = 0
+        for name, array in arrays.items():
+            table.append([name, array.dtype.str, list(array.shape), size])
+            size += -(-array.nbytes // 8) * 8
+        table = dumps(table).encode('utf-8')
+        start = -(-(ARRAYS_HEADER.size + len(table)) // 8) * 8
+        memory = SharedMemory(create = True, size = start + size)
+        ARRAYS_HEADER.pack_into(memory.buf, 0, ARRAYS_MAGIC, ARRAYS_VERSION, len(table))
+        memory.buf[ARRAYS_HEADER.size:ARRAYS_HEADER.size + len(table)] = table
+        shared = SharedArrays(memory)
+        for name, array in arrays.items():
+            shared.arrays[name][...] = array
+        return shared
+
+    @staticmethod
+    def attach(name : str):
+        """Returns the shared arrays in the named block"""
+        return SharedArrays(SharedMemory(name))
+
+    def close(self):
+        """Unmaps the block from this process, leaving it for others"""
+        self.arrays = None
+        self.memory.close()
+
+    def _map(self):
+        magic, version, length = ARRAYS_HEADER.unpack_from(self.memory.buf)
+        if magic != ARRAYS_MAGIC or version != ARRAYS_VERSION:
+            raise ValueError('Not shared arrays')
+        start = -(-(ARRAYS_HEADER.size + length) // 8) * 8
+        table = loads(bytes(self.memory.buf[ARRAYS_HEADER.size:ARRAYS_HEADER.size + length]))
+        self.arrays = {name : np.ndarray(tuple(shape), np.dtype(dtype), self.memory.buf, start + offset) for name, dtype, shape, offset in table}
+
+class GeometryEngine():
+    """Generates fractal geometry in worker processes into shared memory blocks, reporting progress through a queue
+
+    Each worker keeps its own ExpansionCache, spilling to a temporary directory removed when it exits. Results are SharedGeometry centered on the origin, owned by the caller.
+    If index is set, the worker also builds the DetailLevels of the geometry and shares their arrays as its index.
+    If trace_memory is set, the returned DrawStats include the peak memory traced in the worker.
+    """
+
+    def __init__(self, workers = 1):
+        context = multiprocessing.get_context()
+        self.messages = context.SimpleQueue()
+        self.cancelled = context.Value('q', 0)
+        self.executor = ProcessPoolExecutor(max_workers = workers, initializer = _start_worker, initargs = (self.messages, self.cancelled))
+        self.jobs = 0
+
+    def submit(self, fractal_tuple : tuple, size : float, iterations : int, max_sequence = 2000000, stream = False, workers = None, segments = None,
+               index = False, trace_memory = False) -> tuple:
+        """Starts generating geometry with the arguments of LFractal.generate; returns the job number and a future of (SharedGeometry, DrawStats)
+
+        If the exact number of segments is known, such as from a Plan, they are walked straight into a block of that size.
+        """
+        job = self.jobs
+        self.jobs += 1
+        future = self.executor.submit(_generate, job, fractal_tuple, size, iterations, max_sequence, stream, workers, segments, index, trace_memory)
+        return job, future
+
+    @staticmethod
+    def result(future) -> tuple:
+        """Returns the SharedGeometry and DrawStats of a finished job, attached in this process"""
+        name, index_name, stats = future.result()
+        return SharedGeometry.attach(name, index_name), DrawStats.from_dict(stats)
+
+    def cancel(self, job : int):
+        """Cancels the job and every job submitted before it"""
+        with self.cancelled.get_lock():
+            self.cancelled.value = max(self.cancelled.value, job + 1)
+
+    def progress(self) -> list:
+        """Returns the (job, phase, iteration, characters, segments) progress reported since last called"""
+        messages = []
+        while not self.messages.empty():
+            messages.append(self.messages.get())
+        return messages
+
+    def close(self):
+        self.cancel(self.jobs)
+        self.executor.shutdown(cancel_futures = True)
+
+# Define state of each engine worker process
+_worker = {}
+
+class _JobToken():
+    """Cancellation token of a job in an engine worker"""
+
+    def __init__(self, job : int):
+        self.job = job
+
+    def cancelled(self) -> bool:
+        return self.job < _worker['cancelled'].value
+
+    def check(self):
+        """Raises Cancelled if the job has been cancelled"""
+        if self.cancelled():
+            raise Cancelled('Fractal generation forcibly stopped')
+
+def _start_worker(messages, cancelled):
+    _worker['messages'] = messages
+    _worker['cancelled'] = cancelled
+    spill_directory = mkdtemp(prefix = 'fractal-cache-')
+    _worker['cache'] = ExpansionCache(spill_directory = spill_directory)
+    util.Finalize(None, rmtree, (spill_directory, True), exitpriority = 0)
+
+def _generate(job : int, fractal_tuple : tuple, size : float, iterations : int, max_sequence : int, stream : bool, workers : int, segments : int,
+              index : bool, trace_memory : bool) -> tuple:
+    stats = DrawStats(trace_memory = trace_memory)
+    try:
+        return _generate_shared(job, fractal_tuple, size, iterations, max_sequence, stream, workers, segments, index, stats)
+    finally:
+        stats.finish()
+
+def _generate_shared(job : int, fractal_tuple : tuple, size : float, iterations : int, max_sequence : int, stream : bool, workers : int, segments : int,
+                     index : bool, stats : DrawStats) -> tuple:
+    fractal = LFractal()
+    fractal.load_tuple(fractal_tuple)
+    messages = _worker['messages']
+    progress = lambda phase, iteration, characters, segments : messages.put((job, phase, iteration, characters, segments))
+    cache = None if stream else _worker['cache']
+    if segments is None:
+        geometry = fractal.generate(size, iterations, max_sequence, cache, _JobToken(job), progress, stats, stream, workers)
+        shared = SharedGeometry.create(geometry.centered())
+    else:
+        shared = SharedGeometry.allocate(segments)
+        try:
+            geometry = fractal.generate(size, iterations, max_sequence, cache, _JobToken(job), progress, stats, stream, workers, shared.segments)
+        except BaseException:
+            shared.release()
+            raise
+
+        # Center the segments in place
+        center_x, center_y = geometry.center()
+        geometry.segments -= (center_x, center_y, center_x, center_y)
+        min_x, min_y, max_x, max_y = geometry.bounds
+        shared.finish((min_x - center_x, min_y - center_y, max_x - center_x, max_y - center_y), geometry.max_depth)
+    del geometry
+
+    if index:
+        progress('index', iterations, 0, len(shared.segments))
+        try:
+            with stats.phase('index'):
+                shared.index = SharedArrays.create(DetailLevels(shared.geometry, token = _JobToken(job)).arrays())
+        except BaseException:
+            shared.release()
+            raise
+
+    # Hand the blocks over to the process that attaches them, so they outlive this one
+    for block in [shared] if shared.index is None else [shared, shared.index]:
+        resource_tracker.unregister(block.memory._name, 'shared_memory')
+    name, index_name = shared.name, None if shared.index is None else shared.index.name
+    shared.close()
+    return name, index_name, stats.as_dict()
@@ -0,0 +1,73 @@
+import numpy as np
+from geometry import Geometry
+
+def merge_collinear(geometry : Geometry, tolerance = 1e-9) -> Geometry:
+    """Returns the geometry with each run of connected segments pointing the same way merged into one segment"""
+    segments = geometry.segments
+    if len(segments) < 2:
+        return geometry
+    vectors = segments[:, 2:] - segments[:, :2]
+    previous, current = vectors[:-1], vectors[1:]
+    cross = previous[:, 0] * current[:, 1] - previous[:, 1] * current[:, 0]
+    dot = np.einsum('ij,ij->i', previous, current)
+    scale = np.einsum('ij,ij->i', previous, previous) + np.einsum('ij,ij->i', current, current)
+    connected = np.all(segments[1:, :2] == segments[:-1, 2:], axis = 1)
+    joined = connected & (np.abs(cross) <= tolerance * scale) & (dot > 0)
+
+    starts = np.flatnonzero(np.concatenate([[True], ~joined]))
+    ends = np.append(starts[1:] - 1, len(segments) - 1)
+    merged = np.concatenate([segments[starts, :2], segments[ends, 2:]], axis = 1)
+    return Geometry(merged, geometry.bounds, geometry.max_depth)
+
+def dedupe(geometry : Geometry, precision = 1e-6) -> Geometry:
+    """Returns the geometry without segments that repeat an earlier one, in either direction, once snapped to the precision"""
+    segments = geometry.segments
+    if len(segments) < 2:
+        return geometry
+    snapped = np.round(segments / precision).astype(np.int64)
+    reverse = (snapped[:, 0] > snapped[:, 2]) | ((snapped[:, 0] == snapped[:, 2]) & (snapped[:, 1] > snapped[:, 3]))
+    snapped[reverse] = snapped[reverse][:, [2, 3, 0, 1]]
+
+    # Sort stably so the first of each group of equal rows is the earliest segment
+    order = np.lexsort(snapped.T[::-1])
+    ordered = snapped[order]
+    first = order[np.concatenate([[True], np.any(ordered[1:] != ordered[:-1], axis = 1)])]
+    return Geometry(segments[np.sort(first)], geometry.bounds, geometry.max_depth)
+
+def cull(geometry : Geometry, min_length : float) -> Geometry:
+    """Returns the geometry with connected runs of segments shorter than min_length merged, then repeats within min_length removed
+
+    Each run of connected segments keeps only the vertices where its length crosses a multiple of min_length, and its end.
+    """
+    segments = geometry.segments
+    if len(segments) < 2 or min_length <= 0:
+        return geometry
+
+    # Measure length along each run of connected segments
+    breaks = geometry.breaks()
+    is_start = np.zeros(len(segments), dtype = bool)
+    is_start[breaks] = True
+    run = np.cumsum(is_start) - 1
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    total = np.cumsum(lengths)
+    base = total[breaks] - lengths[breaks]
+    end_length = total - base[run]
+    start_length = end_length - lengths
+
+    # Keep vertices that cross a multiple of min_length or end a run
+    is_end = np.append(is_start[1:], True)
+    kept = np.flatnonzero(is_end | (np.floor(end_length / min_length) > np.floor(start_length / min_length)))
+    follows = np.concatenate([[False], run[kept[1:]] == run[kept[:-1]]])
+    starts = np.where(follows[:, None], segments[np.roll(kept, 1), 2:], segments[breaks[run[kept]], :2])
+    culled = Geometry(np.concatenate([starts, segments[kept, 2:]], axis = 1), geometry.bounds, geometry.max_depth)
+    return dedupe(culled, min_length)
+
+def simplify(geometry : Geometry, merge = True, remove_duplicates = True, min_length = None, precision = 1e-6) -> Geometry:
+    """Returns the geometry with duplicate segments removed, collinear runs merged and runs shorter than min_length culled"""
+    if remove_duplicates:
+        geometry = dedupe(geometry, precision)
+    if merge:
+        geometry = merge_collinear(geometry)
+    if min_length:
+        geometry = cull(geometry, min_length)
+    return geometry
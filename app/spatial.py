@@ -0,0 +1,120 @@
+import numpy as np
+from math import ceil, floor, log2, sqrt
+from geometry import Geometry
+from simplify import simplify
+
+class SpatialGrid():
+    """Uniform grid of the segments of a geometry, binned by their midpoints, for finding the segments within a rectangle
+
+    The grid holds only the cell size, the order of the segments by cell and the offset of each cell, read from
+    the geometry in place. These may be computed elsewhere with SpatialGrid.index and given as index.
+    """
+
+    def __init__(self, geometry : Geometry, segments_per_cell = 8, index = None):
+        self.geometry = geometry
+        self.cell, self.order, self.offsets = SpatialGrid.index(geometry, segments_per_cell) if index is None else index
+        min_x, min_y, max_x, max_y = geometry.bounds
+        self.origin = (min_x, min_y)
+        self.columns = int((max_x - min_x) // self.cell) + 1
+        self.rows = int((max_y - min_y) // self.cell) + 1
+
+    @staticmethod
+    def index(geometry : Geometry, segments_per_cell = 8) -> tuple:
+        """Returns the cell size, the order of the segments sorted by cell and the offset of each cell in that order"""
+        segments = geometry.segments
+
+        # Size cells to hold a few segments each and be no smaller than the longest segment
+        min_x, min_y, max_x, max_y = geometry.bounds
+        width, height = max_x - min_x, max_y - min_y
+        count = max(len(segments), 1)
+        longest = float(np.abs(segments[:, 2:] - segments[:, :2]).max()) if len(segments) else 0.0
+        cell = max(sqrt(width * height * segments_per_cell / count), (width + height) * segments_per_cell / count, longest, 1e-9)
+        columns = int(width // cell) + 1
+        rows = int(height // cell) + 1
+
+        # Sort segments by cell so each row of cells is a contiguous slice
+        middle = (segments[:, :2] + segments[:, 2:]) / 2
+        column = np.clip(((middle[:, 0] - min_x) // cell).astype(np.int64), 0, columns - 1)
+        row = np.clip(((middle[:, 1] - min_y) // cell).astype(np.int64), 0, rows - 1)
+        cells = row * columns + column
+        return cell, np.argsort(cells, kind = 'stable'), np.concatenate([[0], np.cumsum(np.bincount(cells, minlength = columns * rows))])
+
+    def query(self, min_x : float, min_y : float, max_x : float, max_y : float) -> np.ndarray:
+        """Returns the indices, in drawing order, of segments whose bounding boxes intersect the rectangle"""
+        # Midpoints of intersecting segments lie within half a cell of the rectangle, as cells are no smaller than any segment
+        reach = self.cell / 2
+        first_column = int(max((min_x - reach - self.origin[0]) // self.cell, 0))
+        last_column = int(min((max_x + reach - self.origin[0]) // self.cell, self.columns - 1))
+        first_row = int(max((min_y - reach - self.origin[1]) // self.cell, 0))
+        last_row = int(min((max_y + reach - self.origin[1]) // self.cell, self.rows - 1))
+        if first_column > last_column or first_row > last_row:
+            return np.zeros(0, dtype = np.int64)
+
+        slices = [self.order[self.offsets[row * self.columns + first_column]:self.offsets[row * self.columns + last_column + 1]]
+                  for row in range(first_row, last_row + 1)]
+        candidates = np.concatenate(slices)
+        segments = self.geometry.segments[candidates]
+        low, high = np.minimum(segments[:, :2], segments[:, 2:]), np.maximum(segments[:, :2], segments[:, 2:])
+        inside = (low[:, 0] <= max_x) & (high[:, 0] >= min_x) & (low[:, 1] <= max_y) & (high[:, 1] >= min_y)
+        return np.sort(candidates[inside])
+
+    def visible(self, min_x : float, min_y : float, max_x : float, max_y : float) -> Geometry:
+        """Returns the geometry of the segments that intersect the rectangle"""
+        return Geometry(self.geometry.segments[self.query(min_x, min_y, max_x, max_y)], self.geometry.bounds, self.geometry.max_depth)
+
+class DetailLevels():
+    """Spatial grids of a geometry simplified for each power of two of the shortest length worth drawing
+
+    Every level is built up front, each simplified from the one before, so navigating to a new zoom only queries a grid.
+    The finest level indexes the geometry itself in place. Levels built elsewhere are restored from the arrays they
+    returned, without copying them. The token is checked between levels.
+    """
+
+    def __init__(self, geometry : Geometry, min_length = 0.5, token = None, arrays = None):
+        self.geometry = geometry
+        self.min_length = min_length
+        self.grids = {}
+        if arrays is not None:
+            self._restore(arrays)
+            return
+
+        # Culling to lengths below the shortest segment removes nothing, and beyond the size of the geometry leaves a segment per run
+        lengths = np.hypot(geometry.segments[:, 2] - geometry.segments[:, 0], geometry.segments[:, 3] - geometry.segments[:, 1])
+        lengths = lengths[lengths > 0]
+        self.finest = floor(log2(lengths.min())) if len(lengths) else 0
+        min_x, min_y, max_x, max_y = geometry.bounds
+        self.coarsest = max(ceil(log2(max(max_x - min_x, max_y - min_y, 2.0 ** self.finest))), self.finest)
+        del lengths
+
+        simplified = geometry
+        for level in range(self.finest, self.coarsest + 1):
+            if token is not None:
+                token.check()
+            if level > self.finest:
+                simplified = simplify(simplified, min_length = 2.0 ** level)
+            self.grids[level] = SpatialGrid(simplified)
+
+    def grid(self, scale : float) -> SpatialGrid:
+        """Returns the grid of the geometry simplified so no drawn run is shorter than min_length once scaled"""
+        return self.grids[min(max(floor(log2(self.min_length / scale)), self.finest), self.coarsest)]
+
+    def arrays(self) -> dict:
+        """Returns the arrays of every level by name, from which the levels of the same geometry can be restored"""
+        arrays = {}
+        for level, grid in self.grids.items():
+            if level > self.finest:
+                arrays[f'{level}.segments'] = grid.geometry.segments
+            arrays[f'{level}.cell'] = np.array([grid.cell])
+            arrays[f'{level}.order'] = grid.order
+            arrays[f'{level}.offsets'] = grid.offsets
+        return arrays
+
+    def _restore(self, arrays : dict):
+        levels = sorted({int(name.split('.')[0]) for name in arrays})
+        self.finest, self.coarsest = levels[0], levels[-1]
+        for level in levels:
+            geometry = self.geometry
+            if level > self.finest:
+                geometry = Geometry(arrays[f'{level}.segments'], geometry.bounds, geometry.max_depth)
+            index = (float(arrays[f'{level}.cell'][0]), arrays[f'{level}.order'], arrays[f'{level}.offsets'])
+            self.grids[level] = SpatialGrid(geometry, index = index)
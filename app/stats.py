@@ -0,0 +1,76 @@
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+class DrawStats():
+    """Records the duration of each phase of drawing a fractal and the sizes it produced
+
+    Each hook is called as hook(phase, seconds, stats) when a phase ends. Peak memory is only
+    recorded while tracemalloc is tracing, which trace_memory starts until finish is called.
+    """
+
+    def __init__(self, hooks = None, trace_memory = False):
+        self.hooks = list(hooks) if hooks else []
+        self.phases = {}
+        self.sequence_lengths = []
+        self.sequence_length = 0
+        self.segments = 0
+        self.max_stack_depth = 0
+        self.peak_memory = None
+        self.segments_per_second = None
+        self._tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        elif trace_memory:
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def phase(self, name : str):
+        """Times the enclosed block as the named phase"""
+        start = perf_counter()
+        yield self
+        self.record(name, perf_counter() - start)
+
+    def record(self, name : str, seconds : float):
+        """Adds the duration of a phase timed elsewhere, such as one spread across Tk events"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        if tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+        for hook in self.hooks:
+            hook(name, seconds, self)
+
+    def total(self) -> float:
+        """Returns the total duration of every phase"""
+        return sum(self.phases.values())
+
+    def bottleneck(self) -> str:
+        """Returns the name of the slowest phase"""
+        return max(self.phases, key = self.phases.get) if self.phases else None
+
+    def finish(self):
+        """Stops tracing memory if these stats started it"""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @staticmethod
+    def from_dict(values : dict, hooks = None):
+        """Returns stats with the plain values of as_dict, such as those recorded in another process"""
+        stats = DrawStats(hooks)
+        stats.phases = dict(values['phases'])
+        for name in ['sequence_lengths', 'sequence_length', 'segments', 'max_stack_depth', 'peak_memory', 'segments_per_second']:
+            setattr(stats, name, values[name])
+        return stats
+
+    def as_dict(self) -> dict:
+        """Returns the stats as a dictionary of plain values"""
+        return {
+            'phases' : dict(self.phases),
+            'total' : self.total(),
+            'sequence_lengths' : list(self.sequence_lengths),
+            'sequence_length' : self.sequence_length,
+            'segments' : self.segments,
+            'max_stack_depth' : self.max_stack_depth,
+            'peak_memory' : self.peak_memory,
+            'segments_per_second' : self.segments_per_second,
+        }
@@ -0,0 +1,142 @@
+import struct
+import numpy as np
+from fractals import LFractal
+from geometry import Geometry, State, walk
+from simplify import merge_collinear
+
+SEGMENTS_MAGIC = b'LSEG'
+SEGMENTS_VERSION = 2
+SEGMENTS_HEADER = struct.Struct('<4sIQ4d')
+
+class StrokeWalker():
+    """Walks program chunks carrying their State and collects strokes, merging collinear runs of DRAW"""
+
+    def __init__(self, angle, unit = 1.0):
+        self.angle = angle
+        self.unit = unit
+        self.bounds = (0.0, 0.0, 0.0, 0.0)
+        self.segments = 0
+
+    def strokes(self, chunks):
+        """Yields (n, 4) arrays of the (x0, y0, x1, y1) strokes drawn while walking the chunks, in walking order
+
+        The last stroke of each chunk is held back until the next chunk shows whether its run goes on.
+        """
+        state = State()
+        min_x = min_y = max_x = max_y = 0.0
+        segments = 0
+        pending = np.zeros((0, 4))
+        for chunk in chunks:
+            part, state = walk(chunk, self.angle, self.unit, state)
+            min_x, min_y = min(min_x, part.bounds[0]), min(min_y, part.bounds[1])
+            max_x, max_y = max(max_x, part.bounds[2]), max(max_y, part.bounds[3])
+            segments += len(part)
+            if not len(part):
+                continue
+            merged = merge_collinear(Geometry(np.concatenate([pending, part.segments]), part.bounds)).segments
+            if len(merged) > 1:
+                yield merged[:-1]
+            pending = merged[-1:]
+        if len(pending):
+            yield pending
+        self.bounds = (min_x, min_y, max_x, max_y)
+        self.segments = segments
+
+def _number(value : float, digits = 3) -> str:
+    text = f'{value:.{digits}f}'.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+def write_svg(chunks, angle, file, unit = 1.0, size = 1024, stroke = 'black', stroke_width = 1, margin = 0.05,
+              commands_per_path = 10000, buffer_size = 4096) -> StrokeWalker:
+    """Streams the strokes of program chunks into a seekable binary file as SVG paths; returns the walker with its bounds and segment count
+
+    Collinear runs are written as single path commands. The view box is only known once the walk is
+    done, so a padded placeholder is written in the header and filled in at the end.
+    """
+    walker = StrokeWalker(angle, unit)
+    file.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+    file.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="'.encode('ascii'))
+    view_box_offset = file.tell()
+    file.write(b' ' * 80 + b'">\n')
+    # Set vector-effect on every path with a style rule, since it is not inherited from the group
+    file.write(b'<style>path { vector-effect: non-scaling-stroke; }</style>\n')
+    file.write(f'<g fill="none" stroke="{stroke}" stroke-width="{stroke_width}" stroke-linecap="round" '
+               f'stroke-linejoin="round">\n'.encode('ascii'))
+
+    buffer = []
+    commands = 0
+    position = None
+    for strokes in walker.strokes(chunks):
+        for x0, y0, x1, y1 in strokes.tolist():
+            if commands == 0 or commands >= commands_per_path:
+                buffer.append('"/>\n<path d="' if commands else '<path d="')
+                position = None
+                commands = 0
+            # Relative commands are differences of rounded positions so rounding does not accumulate
+            x0, y0, x1, y1 = round(x0, 3), round(-y0, 3), round(x1, 3), round(-y1, 3)
+            if position != (x0, y0):
+                buffer.append(f'M{_number(x0)} {_number(y0)}')
+            buffer.append(f'l{_number(x1 - x0)} {_number(y1 - y0)}')
+            position = (x1, y1)
+            commands += 1
+            if len(buffer) >= buffer_size:
+                file.write(''.join(buffer).encode('ascii'))
+                buffer.clear()
+    if commands:
+        buffer.append('"/>\n')
+    buffer.append('</g>\n</svg>\n')
+    file.write(''.join(buffer).encode('ascii'))
+
+    # Fill in the view box placeholder, padded around the bounds of the fractal
+    min_x, min_y, max_x, max_y = walker.bounds
+    pad = max(max_x - min_x, max_y - min_y, unit) * margin
+    view_box = f'{_number(min_x - pad)} {_number(-max_y - pad)} {_number(max_x - min_x + 2 * pad)} {_number(max_y - min_y + 2 * pad)}'
+    end = file.tell()
+    file.seek(view_box_offset)
+    file.write(view_box.encode('ascii').ljust(80))
+    file.seek(end)
+    return walker
+
+def write_segments(chunks, angle, file, unit = 1.0) -> StrokeWalker:
+    """Streams the strokes of program chunks into a seekable binary file of little-endian float64 records; returns the walker
+
+    The header holds a magic number, version, stroke count and bounds, and is filled in at the end.
+    """
+    walker = StrokeWalker(angle, unit)
+    header_offset = file.tell()
+    file.write(SEGMENTS_HEADER.pack(SEGMENTS_MAGIC, SEGMENTS_VERSION, 0, 0.0, 0.0, 0.0, 0.0))
+
+    count = 0
+    for strokes in walker.strokes(chunks):
+        file.write(strokes.astype('<f8', copy = False).tobytes())
+        count += len(strokes)
+
+    end = file.tell()
+    file.seek(header_offset)
+    file.write(SEGMENTS_HEADER.pack(SEGMENTS_MAGIC, SEGMENTS_VERSION, count, *walker.bounds))
+    file.seek(end)
+    return walker
+
+def read_segments(file) -> Geometry:
+    """Reads a file written by write_segments into a Geometry"""
+    magic, version, count, *bounds = SEGMENTS_HEADER.unpack(file.read(SEGMENTS_HEADER.size))
+    if magic != SEGMENTS_MAGIC or version != SEGMENTS_VERSION:
+        raise ValueError('Not a fractal segments file')
+    segments = np.empty((count, 4), dtype = '<f8')
+    if file.readinto(segments) != segments.nbytes:
+        raise ValueError('Truncated fractal segments file')
+    return Geometry(segments.astype(np.float64, copy = False), tuple(bounds))
+
+def program_chunks(fractal : LFractal, iterations : int, token = None):
+    """Returns the compiled program of the fractal as an iterable of chunks, streamed without expanding the sequence"""
+    return fractal.program_stream(iterations, token)
+
+def export_svg(fractal : LFractal, iterations : int, filename : str, unit = 1.0, **options):
+    """Exports the fractal to an SVG file; returns the walker with its bounds and segment count"""
+    with open(filename, 'wb') as file:
+        return write_svg(program_chunks(fractal, iterations), fractal.angle(), file, unit, **options)
+
+def export_segments(fractal : LFractal, iterations : int, filename : str, unit = 1.0):
+    """Exports the fractal to a binary segments file; returns the walker with its bounds and segment count"""
+    with open(filename, 'wb') as file:
+        return write_segments(program_chunks(fractal, iterations), fractal.angle(), file, unit)
@@ -0,0 +1,140 @@
+import argparse, json, sys, tracemalloc
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'app'))
+
+from catalog import Catalog
+from fractals import LFractal, SequenceTooLong
+from bounds import extent
+from geometry import walk
+from raster import rasterize
+
+"""
+Benchmarks every saved fractal over a sweep of iteration depths
+
+Run from the repository root with `python benchmarks/bench.py`.
+"""
+
+FRACTALS_DIRECTORY = 'saved_fractals'
+PHASES = ['expand', 'compile', 'bounds', 'geometry', 'render']
+
+def load_presets(directory : str, names = None) -> dict:
+    """Returns the fractal tuples of the saved fractals, optionally restricted to the given names"""
+    catalog = Catalog(directory)
+    return {name : catalog.get(name) for name in catalog.names() if not names or name in names}
+
+def run_phases(fractal : LFractal, iterations : int, max_sequence : int, image_size : int) -> dict:
+    """Runs every phase once; returns their durations in seconds and the sizes they produced"""
+    times = {}
+    start = perf_counter()
+    sequence = fractal.expand(iterations, max_sequence)
+    times['expand'] = perf_counter() - start
+
+    start = perf_counter()
+    program = fractal.compile(sequence)
+    times['compile'] = perf_counter() - start
+
+    start = perf_counter()
+    extent(fractal, iterations, max_sequence = max_sequence)
+    times['bounds'] = perf_counter() - start
+
+    start = perf_counter()
+    geometry, _ = walk(program, fractal.angle())
+    times['geometry'] = perf_counter() - start
+
+    start = perf_counter()
+    rasterize(geometry, image_size, image_size)
+    times['render'] = perf_counter() - start
+
+    return {'phases' : times, 'sequence_length' : len(sequence), 'program_length' : len(program), 'segments' : len(geometry)}
+
+def benchmark(fractal_tuple : tuple, iterations : int, max_sequence : int, image_size : int, repeat : int) -> dict:
+    """Returns the fastest duration of each phase over the repeats and the peak memory of one traced run"""
+    fractal = LFractal()
+    fractal.load_tuple(fractal_tuple)
+    runs = [run_phases(fractal, iterations, max_sequence, image_size) for _ in range(repeat)]
+    result = runs[0]
+    result['phases'] = {phase : min(run['phases'][phase] for run in runs) for phase in PHASES}
+
+    tracemalloc.start()
+    run_phases(fractal, iterations, max_sequence, image_size)
+    result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+def compare(results : list, baseline : list, tolerance : float) -> int:
+    """Prints the ratio of each phase against a previous run; returns the number of regressions beyond the tolerance
+
+    Depths of the previous run missing from this one, such as those that failed, count as regressions.
+    """
+    previous = {(record['fractal'], record['iterations']) : record for record in baseline}
+    current = {(record['fractal'], record['iterations']) for record in results}
+    regressions = 0
+    for fractal, iterations in sorted(previous.keys() - current):
+        regressions += 1
+        print(f'{fractal:24} {iterations:3}  MISSING')
+    for record in results:
+        old = previous.get((record['fractal'], record['iterations']))
+        if old is None:
+            continue
+        ratios = []
+        for phase in PHASES:
+            new_time, old_time = record['phases'][phase], old['phases'][phase]
+            ratio = new_time / old_time if old_time > 0 else 1.0
+            # Ignore differences too small to measure reliably
+            slower = ratio > tolerance and new_time - old_time > 0.001
+            regressions += slower
+            ratios.append(f'{phase} x{ratio:.2f}{" SLOWER" if slower else ""}')
+        print(f'{record["fractal"]:24} {record["iterations"]:3}  ' + '  '.join(ratios))
+    return regressions
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = 'Benchmark expansion, bounds, geometry and rendering of saved fractals')
+    parser.add_argument('fractals', nargs = '*', help = 'names of saved fractals to benchmark; all if omitted')
+    parser.add_argument('--directory', default = FRACTALS_DIRECTORY, help = 'directory of saved fractals')
+    parser.add_argument('--min-depth', type = int, default = 1, help = 'first iteration depth')
+    parser.add_argument('--max-depth', type = int, default = 20, help = 'last iteration depth')
+    parser.add_argument('--max-sequence', type = int, default = 2000000, help = 'skip depths with longer sequences')
+    parser.add_argument('--image-size', type = int, default = 1024, help = 'width and height of rendered images')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'number of timed runs per depth')
+    parser.add_argument('-o', '--output', help = 'file to write JSON results to')
+    parser.add_argument('--compare', help = 'JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type = float, default = 1.2, help = 'slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = []
+    failures = 0
+    presets = load_presets(args.directory, args.fractals)
+    for name, fractal_tuple in presets.items():
+        for iterations in range(args.min_depth, args.max_depth + 1):
+            try:
+                result = benchmark(fractal_tuple, iterations, args.max_sequence, args.image_size, args.repeat)
+            except SequenceTooLong:
+                break
+            except Exception as e:
+                failures += 1
+                print(f'{name:24} {iterations:3}  FAILED: {e!r}')
+                break
+            results.append({'fractal' : name, 'iterations' : iterations, **result})
+            phases = '  '.join(f'{phase} {seconds:.4f}' for phase, seconds in result['phases'].items())
+            print(f'{name:24} {iterations:3}  {result["sequence_length"]:9} chars  {phases}  peak {result["peak_memory"] // 1024} KiB')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 1)
+
+    if failures:
+        print(f'{failures} failures')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        # Compare only the fractals and depths swept by this run
+        baseline = [record for record in baseline if record['fractal'] in presets and args.min_depth <= record['iterations'] <= args.max_depth]
+        regressions = compare(results, baseline, args.tolerance)
+        print(f'{regressions} regressions beyond x{args.tolerance}')
+        return 1 if regressions or failures else 0
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import json, sys
+from os import listdir, path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'app'))
+
+from fractals import LFractal, sequence_lengths
+
+"""
+Saved fractals shared by the tests
+"""
+
+FRACTALS_DIRECTORY = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'saved_fractals')
+
+def names() -> list:
+    """Returns the names of every saved fractal"""
+    return sorted(path.splitext(filename)[0] for filename in listdir(FRACTALS_DIRECTORY) if filename.endswith('.json'))
+
+def load(name : str) -> LFractal:
+    """Returns the saved fractal of the given name"""
+    fractal = LFractal()
+    with open(path.join(FRACTALS_DIRECTORY, f'{name}.json')) as f:
+        fractal.load_tuple(tuple(json.load(f)))
+    return fractal
+
+def deepest(fractal : LFractal, max_sequence = 20000) -> int:
+    """Returns the most iterations whose sequence is at most max_sequence characters long"""
+    lengths = sequence_lengths(fractal, 20)
+    return max(iterations for iterations, length in enumerate(lengths) if length <= max_sequence)
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from presets import deepest, load, names
+from bounds import extent
+from fractals import LFractal
+from geometry import walk
+
+"""
+Checks the extent composed over the rewrite tree against walking the expanded sequence
+"""
+
+class ExtentTest(unittest.TestCase):
+
+    def assertExtent(self, fractal : LFractal, iterations : int, unit = 1.0):
+        geometry, state = walk(fractal.compile(fractal.expand(iterations)), fractal.angle(), unit)
+        result = extent(fractal, iterations, unit)
+        np.testing.assert_allclose(result[:6], geometry.bounds + (state.x, state.y), atol = 1e-6)
+        self.assertAlmostEqual(result.heading, state.heading * fractal.angle() % 360)
+
+    def test_presets(self):
+        for name in names():
+            fractal = load(name)
+            for iterations in range(deepest(fractal) + 1):
+                with self.subTest(name, iterations = iterations):
+                    self.assertExtent(fractal, iterations, 2.5)
+
+    def test_unbalanced(self):
+        # Rules that leave a position saved are walked instead, once the axiom has one to load
+        fractal = LFractal()
+        fractal.add_character('F', 'DRAW', 'F[+F')
+        fractal.add_character('+', 'LEFT')
+        fractal.add_character('[', 'SAVE')
+        fractal.add_character(']', 'LOAD')
+        fractal.axiom('F]F')
+        fractal.angle(90)
+        for iterations in range(1, 4):
+            with self.subTest(iterations = iterations):
+                self.assertExtent(fractal, iterations)
+
+if __name__ == '__main__':
+    unittest.main()
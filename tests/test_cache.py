@@ -0,0 +1,42 @@
+import tempfile, unittest
+import numpy as np
+from presets import deepest, load, names
+from cache import ExpansionCache
+from fractals import SequenceTooLong
+
+"""
+Generates saved fractals through an ExpansionCache small enough to spill every program it holds
+"""
+
+class ExpansionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ExpansionCache(max_bytes = 1, spill_directory = self.directory.name)
+
+    def tearDown(self):
+        self.cache.clear()
+        self.directory.cleanup()
+
+    def test_spilled_programs(self):
+        fractals = [load(name) for name in names()[:3]]
+        expected = [fractal.generate(1, deepest(fractal)) for fractal in fractals]
+        for fractal in fractals:
+            fractal.generate(1, deepest(fractal), cache = self.cache)
+        self.assertEqual(len(self.cache.spilled), 2)
+
+        for fractal, geometry in zip(fractals, expected):
+            with self.subTest(fractal.get_tuple()[3]):
+                cached = fractal.generate(1, deepest(fractal), cache = self.cache)
+                self.assertNotIn('expand', fractal.stats.phases)
+                np.testing.assert_array_equal(cached.segments, geometry.segments)
+        self.assertIsInstance(self.cache.get(ExpansionCache.key(fractals[0]), deepest(fractals[0])), np.memmap)
+
+    def test_max_sequence_on_hit(self):
+        fractal = load('Dragon Curve')
+        fractal.generate(1, 10, cache = self.cache)
+        with self.assertRaises(SequenceTooLong):
+            fractal.generate(1, 10, max_sequence = 1000, cache = self.cache)
+
+if __name__ == '__main__':
+    unittest.main()
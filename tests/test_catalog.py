@@ -0,0 +1,37 @@
+import tempfile, unittest
+from presets import FRACTALS_DIRECTORY, names
+from catalog import Catalog
+from fractals import LFractal
+
+"""
+Checks that fractals loaded from the catalog do not share state with its cache or each other
+"""
+
+class CatalogTest(unittest.TestCase):
+
+    def test_get_returns_new_tuples(self):
+        catalog = Catalog(FRACTALS_DIRECTORY)
+        name = names()[0]
+        fractal = LFractal()
+        fractal.load_tuple(catalog.get(name))
+        fractal.add_character('Q', 'DRAW', 'QQ')
+        fractal.axiom('Q')
+        self.assertNotIn('Q', catalog.get(name)[0])
+        self.assertEqual(catalog.get(name), catalog.get(name))
+        self.assertIsNot(catalog.get(name)[1], catalog.get(name)[1])
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as directory:
+            catalog = Catalog(directory)
+            fractal = LFractal()
+            fractal.add_character('F', 'DRAW', 'F+F')
+            fractal.add_character('+', 'LEFT')
+            fractal.axiom('F')
+            fractal.angle(90)
+            catalog.save('Test', fractal.get_tuple())
+            fractal.add_character('G', 'MOVE')
+            self.assertEqual(catalog.names(), ['Test'])
+            self.assertEqual(catalog.get('Test'), (['+', 'F'], {'F' : 'DRAW', '+' : 'LEFT'}, {'F' : 'F+F', '+' : '+'}, 'F', 90))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from collections import Counter
+from presets import deepest, load, names
+from fractals import LFractal, SequenceTooLong, counts, sequence_lengths
+from geometry import OP_DRAW, OP_LEFT
+
+"""
+Checks expansion against the concatenation loop it replaced and the symbol counts predicted without it, and compilation of symbols without a function
+"""
+
+def concatenate(fractal : LFractal, iterations : int) -> str:
+    """Returns the sequence built one character at a time, as draw did before expand"""
+    sequence = fractal.axiom()
+    for _ in range(iterations):
+        next_sequence = ''
+        for character in sequence:
+            next_sequence += fractal.rules[character]
+        sequence = next_sequence
+    return sequence
+
+class ExpandTest(unittest.TestCase):
+
+    def test_presets(self):
+        for name in names():
+            fractal = load(name)
+            for iterations in range(5):
+                with self.subTest(name, iterations = iterations):
+                    self.assertEqual(fractal.expand(iterations), concatenate(fractal, iterations))
+
+    def test_counts(self):
+        for name in names():
+            fractal = load(name)
+            with self.subTest(name):
+                self.assertEqual(sequence_lengths(fractal, 4), [len(fractal.expand(iterations)) for iterations in range(5)])
+                self.assertEqual({symbol : count for symbol, count in counts(fractal, 4).items() if count}, Counter(fractal.expand(4)))
+
+    def test_max_sequence(self):
+        fractal = load('Dragon Curve')
+        length = len(concatenate(fractal, 4))
+        self.assertEqual(len(fractal.expand(4, max_sequence = length)), length)
+        with self.assertRaises(SequenceTooLong):
+            fractal.expand(4, max_sequence = length - 1)
+
+class ProgramStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        # Shrink blocks and chunks so every preset streams many of each
+        self.sizes = LFractal.BLOCK_SIZE, LFractal.CHUNK_SIZE
+        LFractal.BLOCK_SIZE, LFractal.CHUNK_SIZE = 16, 256
+
+    def tearDown(self):
+        LFractal.BLOCK_SIZE, LFractal.CHUNK_SIZE = self.sizes
+
+    def test_presets(self):
+        for name in names():
+            fractal = load(name)
+            iterations = deepest(fractal)
+            with self.subTest(name):
+                self.assertEqual(b''.join(fractal.program_stream(iterations)), fractal.compile(fractal.expand(iterations)))
+
+class CompileTest(unittest.TestCase):
+
+    def test_symbols_without_function(self):
+        fractal = LFractal()
+        fractal.add_character('F', 'DRAW', 'F+GX')
+        fractal.add_character('+', 'LEFT')
+        fractal.add_character('G', '', 'GG')
+        fractal.add_character('X', 'JUMP')
+        self.assertEqual(fractal.compile('F+GXF'), bytes([OP_DRAW, OP_LEFT, OP_DRAW]))
+        self.assertEqual(fractal.compile('GX'), b'')
+
+if __name__ == '__main__':
+    unittest.main()
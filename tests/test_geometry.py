@@ -0,0 +1,94 @@
+import random, unittest
+import numpy as np
+from presets import deepest, load, names
+from geometry import State, directions, period, walk, OP_DRAW, OP_MOVE, OP_RIGHT, OP_LEFT, OP_SAVE, OP_LOAD
+
+"""
+Checks the vectorized walk against a turtle that follows a compiled program one opcode at a time
+"""
+
+def turtle_walk(program : bytes, angle, unit = 1.0, state = None) -> tuple:
+    """Returns the segments, deepest stack and final State of the program walked one opcode at a time"""
+    state = state if state is not None else State()
+    steps = directions(angle, unit)
+    x, y, heading, stack = state.x, state.y, state.heading, list(state.stack)
+    segments = []
+    max_depth = len(stack)
+    for op in program:
+        if op == OP_DRAW or op == OP_MOVE:
+            next_x, next_y = x + steps[heading][0], y + steps[heading][1]
+            if op == OP_DRAW:
+                segments.append((x, y, next_x, next_y))
+            x, y = next_x, next_y
+        elif op == OP_LEFT:
+            heading = (heading + 1) % period(angle)
+        elif op == OP_RIGHT:
+            heading = (heading - 1) % period(angle)
+        elif op == OP_SAVE:
+            stack.append((x, y, heading))
+            max_depth = max(max_depth, len(stack))
+        elif op == OP_LOAD:
+            x, y, heading = stack.pop()
+    return np.array(segments).reshape(-1, 4), max_depth, State(x, y, heading, stack)
+
+class WalkTest(unittest.TestCase):
+
+    def assertStatesEqual(self, state : State, expected : State):
+        np.testing.assert_allclose([state.x, state.y], [expected.x, expected.y], atol = 1e-6)
+        self.assertEqual(state.heading, expected.heading)
+        self.assertEqual(len(state.stack), len(expected.stack))
+        for entry, expected_entry in zip(state.stack, expected.stack):
+            np.testing.assert_allclose(entry[:2], expected_entry[:2], atol = 1e-6)
+            self.assertEqual(entry[2], expected_entry[2])
+
+    def test_presets(self):
+        for name in names():
+            with self.subTest(name):
+                fractal = load(name)
+                program = fractal.compile(fractal.expand(deepest(fractal)))
+                geometry, state = walk(program, fractal.angle())
+                segments, max_depth, expected = turtle_walk(program, fractal.angle())
+                np.testing.assert_allclose(geometry.segments, segments, atol = 1e-6)
+                self.assertEqual(geometry.max_depth, max_depth)
+                self.assertStatesEqual(state, expected)
+
+    def test_presets_in_chunks(self):
+        generator = random.Random(0)
+        for name in names():
+            with self.subTest(name):
+                fractal = load(name)
+                program = fractal.compile(fractal.expand(deepest(fractal)))
+                cuts = sorted(generator.sample(range(1, len(program)), min(20, len(program) - 1)))
+                parts = []
+                state = State()
+                for start, end in zip([0] + cuts, cuts + [len(program)]):
+                    part, state = walk(program[start:end], fractal.angle(), state = state)
+                    parts.append(part.segments)
+                segments, _, expected = turtle_walk(program, fractal.angle())
+                np.testing.assert_allclose(np.concatenate(parts), segments, atol = 1e-6)
+                self.assertStatesEqual(state, expected)
+
+    def test_carried_stack(self):
+        # Return through positions saved by earlier chunks, then save again
+        chunks = [bytes([OP_DRAW, OP_SAVE, OP_LEFT, OP_DRAW, OP_SAVE, OP_RIGHT, OP_RIGHT]),
+                  bytes([OP_DRAW, OP_LOAD, OP_DRAW, OP_LOAD, OP_MOVE, OP_SAVE, OP_LEFT]),
+                  bytes([OP_SAVE, OP_DRAW, OP_LOAD, OP_LOAD, OP_DRAW])]
+        state = State()
+        parts = []
+        for chunk in chunks:
+            part, state = walk(chunk, 90, state = state)
+            parts.append(part.segments)
+        segments, _, expected = turtle_walk(b''.join(chunks), 90)
+        np.testing.assert_allclose(np.concatenate(parts), segments, atol = 1e-12)
+        self.assertStatesEqual(state, expected)
+        self.assertEqual(state.stack, [])
+
+    def test_pop_from_empty_stack(self):
+        with self.assertRaises(IndexError):
+            walk(bytes([OP_DRAW, OP_LOAD]), 90)
+        _, state = walk(bytes([OP_SAVE]), 90)
+        with self.assertRaises(IndexError):
+            walk(bytes([OP_LOAD, OP_LOAD]), 90, state = state)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from presets import deepest, load, names
+from bounds import Unbalanced
+from geometry import directions, period
+from instancing import Node, instance, nodes
+
+"""
+Checks that the instanced tree of each saved fractal flattens to exactly the segments it generates
+"""
+
+def flatten(node : Node, steps : np.ndarray, turns : int, x = 0.0, y = 0.0, heading = 0) -> list:
+    """Returns the strokes of the node and every instance below it, placed at (x, y) and rotated by heading turns"""
+    cos, sin = steps[heading]
+    segments = [(x + cos * x0 - sin * y0, y + sin * x0 + cos * y0, x + cos * x1 - sin * y1, y + sin * x1 + cos * y1) for x0, y0, x1, y1 in node.strokes]
+    for child, child_x, child_y, turn in node.instances:
+        segments += flatten(child, steps, turns, x + cos * child_x - sin * child_y, y + sin * child_x + cos * child_y, (heading + turn) % turns)
+    return segments
+
+def rows(segments) -> np.ndarray:
+    """Returns the segments rounded and sorted, so segments walked in a different order compare equal"""
+    rounded = np.round(np.asarray(segments, dtype = np.float64).reshape(-1, 4), 6) + 0.0
+    return rounded[np.lexsort(rounded.T[::-1])]
+
+class InstanceTest(unittest.TestCase):
+
+    def test_presets(self):
+        for name in names():
+            fractal = load(name)
+            iterations = deepest(fractal)
+            with self.subTest(name):
+                try:
+                    root = instance(fractal, iterations)
+                except Unbalanced:
+                    continue
+                geometry = fractal.generate(1, iterations)
+                self.assertEqual(root.segments, len(geometry))
+                self.assertTrue(all(node.segments for node in nodes(root)))
+                segments = flatten(root, directions(fractal.angle()), period(fractal.angle()))
+                np.testing.assert_array_equal(rows(segments), rows(geometry.segments))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import random, unittest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from presets import deepest, load, names
+from geometry import State, directions, period, walk
+from parallel import parallel_walk, summarize
+
+"""
+Checks that chunk transforms compose to the states a serial walk reaches, and that parallel walks match it
+"""
+
+def split(program : bytes, generator : random.Random, count = 20) -> list:
+    cuts = sorted(generator.sample(range(1, len(program)), min(count, len(program) - 1)))
+    return [program[start:end] for start, end in zip([0] + cuts, cuts + [len(program)])]
+
+class TransformTest(unittest.TestCase):
+
+    def assertStatesEqual(self, state : State, expected : State):
+        np.testing.assert_allclose([state.x, state.y], [expected.x, expected.y], atol = 1e-6)
+        self.assertEqual(state.heading, expected.heading)
+        self.assertEqual(len(state.stack), len(expected.stack))
+        for entry, expected_entry in zip(state.stack, expected.stack):
+            np.testing.assert_allclose(entry[:2], expected_entry[:2], atol = 1e-6)
+            self.assertEqual(entry[2], expected_entry[2])
+
+    def test_apply(self):
+        generator = random.Random(0)
+        for name in names():
+            with self.subTest(name):
+                fractal = load(name)
+                angle = fractal.angle()
+                state = State()
+                for chunk in split(fractal.compile(fractal.expand(deepest(fractal))), generator):
+                    transformed = summarize(chunk, angle, 2.0).apply(state, directions(angle), period(angle))
+                    _, state = walk(chunk, angle, 2.0, state)
+                    self.assertStatesEqual(transformed, state)
+
+    def test_compose(self):
+        generator = random.Random(1)
+        for name in names():
+            with self.subTest(name):
+                fractal = load(name)
+                angle = fractal.angle()
+                program = fractal.compile(fractal.expand(deepest(fractal)))
+                state = State()
+                for chunk in split(program, generator):
+                    state = summarize(chunk, angle).apply(state, directions(angle), period(angle))
+                self.assertStatesEqual(state, walk(program, angle)[1])
+
+    def test_pop_from_empty_stack(self):
+        with self.assertRaises(IndexError):
+            summarize(bytes([6, 1]), 90).apply(State(), directions(90), period(90))
+
+    def test_parallel_walk(self):
+        generator = random.Random(2)
+        with ThreadPoolExecutor(2) as executor:
+            for name in names():
+                with self.subTest(name):
+                    fractal = load(name)
+                    program = fractal.compile(fractal.expand(deepest(fractal)))
+                    expected, state = walk(program, fractal.angle())
+                    out = np.empty((len(expected), 4))
+                    geometry, final = parallel_walk(split(program, generator), fractal.angle(), executor = executor, out = out, window = 3)
+                    self.assertIs(geometry.segments, out)
+                    np.testing.assert_allclose(geometry.segments, expected.segments, atol = 1e-6)
+                    np.testing.assert_allclose(geometry.bounds, expected.bounds, atol = 1e-6)
+                    self.assertStatesEqual(final, state)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+from presets import load
+from fractals import SequenceTooLong
+from planning import Plan, plan
+from shared import GeometryEngine
+
+"""
+Generates a saved fractal with every planned strategy the way the GUI does
+
+Run from the repository root with `python -m pytest tests` or `python -m unittest discover tests`.
+"""
+
+class PlanStrategyTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fractal = load('Board')
+        cls.iterations = 5
+        cls.expected = cls.fractal.generate(1, cls.iterations).centered()
+
+    def setUp(self):
+        # Start a new engine for each test, so no strategy reuses a sequence cached by another
+        self.engine = GeometryEngine()
+
+    def tearDown(self):
+        self.engine.close()
+
+    def generate(self, fractal_plan : Plan, max_sequence : int):
+        # Submit the plan to the engine with the same arguments as Window._generate_in_background
+        job, future = self.engine.submit(self.fractal.get_tuple(), 1, fractal_plan.iterations, max_sequence, stream = fractal_plan.stream,
+                                         workers = fractal_plan.workers, segments = fractal_plan.segments)
+        shared, stats = GeometryEngine.result(future)
+        try:
+            self.assertEqual(len(shared.geometry), fractal_plan.segments)
+            self.assertEqual(stats.segments, fractal_plan.segments)
+            np.testing.assert_allclose(shared.geometry.segments, self.expected.segments, atol = 1e-6)
+        finally:
+            shared.release()
+
+    def test_materialize(self):
+        fractal_plan = plan(self.fractal, self.iterations)
+        self.assertEqual(fractal_plan.strategy, Plan.MATERIALIZE)
+        self.generate(fractal_plan, 2000000)
+
+    def test_stream(self):
+        max_sequence = 1000
+        fractal_plan = plan(self.fractal, self.iterations, max_sequence, workers = 1)
+        self.assertEqual(fractal_plan.strategy, Plan.STREAM)
+        self.generate(fractal_plan, max_sequence)
+
+    def test_parallel(self):
+        max_sequence = 1000
+        parallel_length = Plan.PARALLEL_LENGTH
+        Plan.PARALLEL_LENGTH = 0
+        try:
+            fractal_plan = plan(self.fractal, self.iterations, max_sequence, workers = 2)
+        finally:
+            Plan.PARALLEL_LENGTH = parallel_length
+        self.assertEqual(fractal_plan.strategy, Plan.PARALLEL)
+        self.generate(fractal_plan, max_sequence)
+
+    def test_refuse(self):
+        fractal_plan = plan(self.fractal, self.iterations, max_bytes = 1)
+        self.assertEqual(fractal_plan.strategy, Plan.REFUSE)
+        with self.assertRaises(SequenceTooLong):
+            fractal_plan.check()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import io, random, unittest
+import numpy as np
+from presets import deepest, load, names
+from geometry import walk
+from simplify import merge_collinear
+from vector import StrokeWalker, read_segments, write_segments
+
+"""
+Checks strokes walked chunk by chunk against merging the segments of a whole walk, and the segments file format
+"""
+
+def split(program : bytes, generator : random.Random, count = 20) -> list:
+    cuts = sorted(generator.sample(range(1, len(program)), min(count, len(program) - 1)))
+    return [program[start:end] for start, end in zip([0] + cuts, cuts + [len(program)])]
+
+class StrokeWalkerTest(unittest.TestCase):
+
+    def test_strokes_in_chunks(self):
+        generator = random.Random(0)
+        for name in names():
+            with self.subTest(name):
+                fractal = load(name)
+                program = fractal.compile(fractal.expand(deepest(fractal)))
+                geometry, _ = walk(program, fractal.angle())
+                walker = StrokeWalker(fractal.angle())
+                strokes = np.concatenate(list(walker.strokes(split(program, generator))))
+                np.testing.assert_allclose(strokes, merge_collinear(geometry).segments, atol = 1e-6)
+                self.assertEqual(walker.segments, len(geometry))
+                np.testing.assert_allclose(walker.bounds, geometry.bounds, atol = 1e-6)
+
+    def test_segments_file(self):
+        fractal = load(names()[0])
+        program = fractal.compile(fractal.expand(deepest(fractal)))
+        file = io.BytesIO()
+        walker = write_segments([program], fractal.angle(), file)
+        file.seek(0)
+        geometry = read_segments(file)
+        np.testing.assert_array_equal(geometry.segments, merge_collinear(walk(program, fractal.angle())[0]).segments)
+        self.assertEqual(geometry.bounds, walker.bounds)
+
+        file.seek(0)
+        with self.assertRaises(ValueError):
+            read_segments(io.BytesIO(file.read()[:-8]))
+
+if __name__ == '__main__':
+    unittest.main()